@@ -0,0 +1,78 @@
+# Compares the lxml clean_html against the original BeautifulSoup version.
+#
+# Usage:
+#     python benchmarks/bench_clean_html.py [--number N]
+#
+# Every fixture is first checked for identical output; the script exits with
+# a non-zero status if any of them differ.
+
+import argparse
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "..", "sesgocero_scrapper"))
+
+from sesgocero_scrapper.cleaning import clean_html, clean_html_bs  # noqa: E402
+
+FIXTURES_DIR = os.path.join(ROOT, "fixtures", "clean_html")
+
+
+def load_fixtures():
+    fixtures = []
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+            if name.endswith(".txt"):
+                # One plain-text field (title, subtitle) per line
+                for i, line in enumerate(f.read().splitlines()):
+                    fixtures.append((f"{name}:{i + 1}", line))
+            else:
+                fixtures.append((name, f.read()))
+    return fixtures
+
+
+def check_parity(fixtures):
+    failures = 0
+    for name, text in fixtures:
+        expected = clean_html_bs(text)
+        actual = clean_html(text)
+        if actual != expected:
+            failures += 1
+            print(f"MISMATCH {name}\n  bs4:  {expected!r}\n  lxml: {actual!r}")
+    print(f"Parity: {len(fixtures) - failures}/{len(fixtures)} fixtures match")
+    return failures == 0
+
+
+def bench(func, fixtures, number):
+    def run():
+        for _, text in fixtures:
+            func(text)
+
+    return min(timeit.repeat(run, number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    if not check_parity(fixtures):
+        sys.exit(1)
+
+    size = sum(len(text) for _, text in fixtures)
+    results = {}
+    for label, func in [("bs4", clean_html_bs), ("lxml", clean_html)]:
+        seconds = bench(func, fixtures, args.number)
+        results[label] = seconds
+        print(
+            f"{label:>5}: {seconds * 1000:8.3f} ms per pass, "
+            f"{len(fixtures) / seconds:10.0f} fields/s, "
+            f"{size / seconds / 1e6:6.2f} MB/s"
+        )
+    print(f"Speedup: {results['bs4'] / results['lxml']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# Offline end-to-end crawl benchmark.
+#
+# Serves the listing and article fixtures of every source from a local HTTP
+# server and runs run_all_spiders.run_all against it, one spider per worker
+# process so CPU time and peak RSS can be attributed to each spider. Items
+# go to an in-memory MongoDB stand-in unless --mongodb-uri is given.
+#
+# Usage:
+#     python benchmarks/bench_crawl.py [--articles N] [--latency-ms MS]
+#         [--jitter-ms MS] [--error-rate R] [--page-kb KB] [--per-page N]
+#         [--no-delay] [--spiders NAME ...] [--mongodb-uri URI] [--output FILE]
+
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.join(ROOT, "..", "sesgocero_scrapper")
+sys.path.insert(0, PROJECT_DIR)
+os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "sesgocero_scrapper.settings")
+
+import localsites  # noqa: E402
+
+
+def spider_start_urls(names=None):
+    from scrapy import spiderloader
+    from scrapy.utils.project import get_project_settings
+
+    loader = spiderloader.SpiderLoader.from_settings(get_project_settings())
+    return {name: loader.load(name).start_urls[0] for name in names or loader.list()}
+
+
+def crawl_overrides(server_url, no_delay):
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    downloader_middlewares = settings.getdict("DOWNLOADER_MIDDLEWARES")
+    downloader_middlewares["localsites.LocalSitesMiddleware"] = 50
+    extensions = settings.getdict("EXTENSIONS")
+    extensions["localsites.CrawlMetrics"] = 0
+
+    overrides = {
+        "LOCAL_SITES_URL": server_url,
+        "DOWNLOADER_MIDDLEWARES": downloader_middlewares,
+        "EXTENSIONS": extensions,
+        # Measure the full download, parse and store path on every run
+        "KNOWN_URLS_ENABLED": False,
+        "REVALIDATION_ENABLED": False,
+        "HTTPCACHE_ENABLED": False,
+        "TELNETCONSOLE_ENABLED": False,
+        "LOG_LEVEL": "WARNING",
+    }
+    if no_delay:
+        overrides["DOWNLOAD_DELAY"] = 0
+    return overrides
+
+
+def run_worker(args):
+    # Runs in its own process: one spider, one reactor
+    if args.mongodb_uri:
+        os.environ["MONGODB_URI"] = args.mongodb_uri
+    else:
+        from memory_mongo import MemoryClient
+        from sesgocero_scrapper import storage
+
+        storage.MongoClient = MemoryClient
+
+    from sesgocero_scrapper.run_all_spiders import run_all
+
+    overrides = crawl_overrides(args.server_url, args.no_delay)
+    # A fresh near-duplicate index, so earlier runs do not change the work
+    state_dir = tempfile.mkdtemp(prefix="bench_crawl_")
+    overrides["NEAR_DUPLICATE_DB"] = os.path.join(state_dir, "near_duplicates.db")
+    overrides["METRICS_DIR"] = state_dir
+    overrides["METRICS_PORT"] = 0
+    if args.parse_offload:
+        overrides["PARSE_OFFLOAD_ENABLED"] = True
+    stages = {}
+    try:
+        run_all(spider_names=[args.worker], overrides=overrides)
+        summary = os.path.join(state_dir, f"{args.worker}.json")
+        if os.path.exists(summary):
+            with open(summary) as f:
+                stages = json.load(f)["stages"]
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # Parse worker processes, once they have exited
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    result = dict(localsites.RESULTS.get(args.worker, {}))
+    # Per-stage latency summary from the StageMetrics extension
+    result["stages"] = stages
+    result["cpu_time_s"] = (
+        usage.ru_utime + usage.ru_stime + children.ru_utime + children.ru_stime
+    )
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    result["peak_rss_mb"] = usage.ru_maxrss * scale / (1024 * 1024)
+    with open(args.result_file, "w") as f:
+        json.dump(result, f)
+
+
+def run_benchmark(args):
+    sites = spider_start_urls(args.spiders)
+    server = localsites.LocalSitesServer(
+        sites,
+        articles=args.articles,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        page_kb=args.page_kb,
+        per_page=args.per_page,
+    ).start()
+
+    results = {}
+    try:
+        for spider_name in sites:
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+                result_file = f.name
+            command = [
+                sys.executable,
+                os.path.abspath(__file__),
+                "--worker",
+                spider_name,
+                "--server-url",
+                server.url,
+                "--result-file",
+                result_file,
+            ]
+            if args.no_delay:
+                command.append("--no-delay")
+            if args.parse_offload:
+                command.append("--parse-offload")
+            if args.mongodb_uri:
+                command += ["--mongodb-uri", args.mongodb_uri]
+
+            completed = subprocess.run(command, cwd=PROJECT_DIR)
+            with open(result_file) as f:
+                content = f.read()
+            os.unlink(result_file)
+            result = json.loads(content) if content else {}
+            result["exit_code"] = completed.returncode
+            results[spider_name] = result
+    finally:
+        server.stop()
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "parameters": {
+            "articles": args.articles,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "error_rate": args.error_rate,
+            "page_kb": args.page_kb,
+            "per_page": args.per_page,
+            "no_delay": args.no_delay,
+            "parse_offload": args.parse_offload,
+            "mongodb": "external" if args.mongodb_uri else "memory",
+        },
+        "spiders": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    print_summary(results)
+    print(f"\nResults written to {args.output}")
+    return 0 if all(r["exit_code"] == 0 for r in results.values()) else 1
+
+
+def print_summary(results):
+    print(
+        f"{'spider':<15} {'items':>6} {'items/s':>9} {'pages/s':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'cpu s':>7} {'rss MB':>7}"
+    )
+    for name, r in results.items():
+        latency = r.get("item_latency_ms", {})
+        print(
+            f"{name:<15} {r.get('items', 0):>6} {r.get('items_per_s', 0):>9.1f} "
+            f"{r.get('pages_per_s', 0):>9.1f} {latency.get('p50') or 0:>8.1f} "
+            f"{latency.get('p95') or 0:>8.1f} {latency.get('p99') or 0:>8.1f} "
+            f"{r.get('cpu_time_s', 0):>7.2f} {r.get('peak_rss_mb', 0):>7.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--page-kb", type=int, default=120)
+    parser.add_argument(
+        "--per-page", type=int, default=0, help="listing entries per page (0: all)"
+    )
+    parser.add_argument(
+        "--no-delay", action="store_true", help="override DOWNLOAD_DELAY with 0"
+    )
+    parser.add_argument(
+        "--parse-offload",
+        action="store_true",
+        help="extract and clean articles in worker processes",
+    )
+    parser.add_argument("--spiders", nargs="*")
+    parser.add_argument("--mongodb-uri")
+    parser.add_argument("--output", default="crawl_benchmark.json")
+    # Internal: worker process options
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--server-url", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return 0
+    args.output = os.path.abspath(args.output)
+    return run_benchmark(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
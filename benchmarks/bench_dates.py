@@ -0,0 +1,171 @@
+# Compares the shared dates.parse_date against the per-spider parse_date
+# helpers it replaced.
+#
+# Usage:
+#     python benchmarks/bench_dates.py [--number N]
+#
+# Every row of fixtures/dates.tsv is first checked against its expected
+# value; the script exits with a non-zero status if any of them differ.
+
+from datetime import datetime
+import argparse
+import os
+import re
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "..", "sesgocero_scrapper"))
+
+from sesgocero_scrapper.dates import parse_date  # noqa: E402
+
+CORPUS = os.path.join(ROOT, "fixtures", "dates.tsv")
+
+
+def legacy_spanish(date_str, pattern, order):
+    # Same steps as the old spider helpers: month map rebuilt and regex
+    # compiled on every call, then a string round trip through strptime
+    month_map = {
+        "enero": "01",
+        "febrero": "02",
+        "marzo": "03",
+        "abril": "04",
+        "mayo": "05",
+        "junio": "06",
+        "julio": "07",
+        "agosto": "08",
+        "septiembre": "09",
+        "octubre": "10",
+        "noviembre": "11",
+        "diciembre": "12",
+    }
+    match = re.search(pattern, date_str.lower())
+    if match:
+        parts = dict(zip(order, match.groups()))
+        month_num = month_map.get(parts["month"])
+        if month_num:
+            formatted_date = f"{parts['year']}-{month_num}-{parts['day'].zfill(2)}"
+            try:
+                return datetime.strptime(formatted_date, "%Y-%m-%d")
+            except ValueError:
+                return None
+    return None
+
+
+def legacy_el_tiempo(date_str):
+    if " " in date_str:
+        return datetime.strptime(date_str.split(" ")[0], "%d.%m.%Y")
+    return legacy_spanish(
+        date_str, r"(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})", ("day", "month", "year")
+    )
+
+
+def legacy_el_espectador(date_str):
+    return legacy_spanish(
+        date_str.split(" - ")[0].strip(),
+        r"(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})",
+        ("day", "month", "year"),
+    )
+
+
+def legacy_rcn(date_str):
+    return legacy_spanish(
+        date_str, r"(\w+)\s+(\d{1,2})\s+de\s+(\d{4})", ("month", "day", "year")
+    )
+
+
+def legacy_blu_radio(date_str):
+    return legacy_spanish(
+        date_str, r"(\d{1,2})\s+de\s+(\w+),\s+(\d{4})", ("day", "month", "year")
+    )
+
+
+def legacy_iso(date_str):
+    date_str = date_str.split("T")[0]
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+LEGACY = {
+    "el_tiempo": legacy_el_tiempo,
+    "el_espectador": legacy_el_espectador,
+    "el_nuevo_siglo": legacy_el_espectador,
+    "rcn": legacy_rcn,
+    "blu_radio": legacy_blu_radio,
+    "el_pais": legacy_iso,
+    "silla_vacia": legacy_iso,
+}
+
+
+def load_corpus():
+    rows = []
+    with open(CORPUS, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            source, date_str, expected = line.rstrip("\n").split("\t")
+            rows.append((source, date_str, expected))
+    return rows
+
+
+def check_corpus(rows):
+    failures = 0
+    for source, date_str, expected in rows:
+        parsed = parse_date(date_str)
+        actual = parsed.isoformat() if parsed else ""
+        if actual != expected:
+            failures += 1
+            print(f"MISMATCH [{source}] {date_str!r}: {actual!r} != {expected!r}")
+    print(f"Corpus: {len(rows) - failures}/{len(rows)} rows match")
+    return failures == 0
+
+
+def legacy_parse(source, date_str):
+    try:
+        return LEGACY[source](date_str)
+    except ValueError:
+        return None
+
+
+def bench(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = load_corpus()
+    if not check_corpus(rows):
+        sys.exit(1)
+
+    # Only rows the old helpers could handle, so both sides do the same work
+    comparable = [
+        (source, date_str)
+        for source, date_str, _ in rows
+        if source in LEGACY and date_str and legacy_parse(source, date_str)
+    ]
+
+    def run_legacy():
+        for source, date_str in comparable:
+            legacy_parse(source, date_str)
+
+    def run_shared():
+        for _, date_str in comparable:
+            parse_date(date_str)
+
+    legacy = bench(run_legacy, args.number)
+    shared = bench(run_shared, args.number)
+    for label, seconds in [("legacy", legacy), ("shared", shared)]:
+        print(
+            f"{label:>6}: {seconds / len(comparable) * 1e6:6.2f} us per date, "
+            f"{len(comparable) / seconds:10.0f} dates/s"
+        )
+    print(f"Speedup: {legacy / shared:.1f}x over {len(comparable)} dates")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# Times export_articles.py on a generated collection, in both formats,
+# against the in-memory stand-in for MongoDB (memory_mongo.py).
+#
+# Usage:
+#     python benchmarks/bench_export.py [--docs N] [--format parquet|jsonl]
+#
+# Every export is first read back and checked to hold each document exactly
+# once. The collection includes the documents whose partition comes back
+# later in the sorted cursor: a null date and an unparseable date in the
+# same source (both month=unknown, sorted before and after the ISO dates)
+# and two sources that map to the same directory. The script
+# exits with a non-zero status if any document is missing or repeated.
+
+import argparse
+from collections import Counter
+from datetime import datetime, timezone
+import glob
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, ".."))
+
+import export_articles  # noqa: E402
+from memory_mongo import MemoryClient  # noqa: E402
+
+export_articles.MongoClient = MemoryClient
+
+SOURCES = ["El Tiempo", "El Espectador", "RCN", "Blu Radio", "La Silla Vacia"]
+
+
+def documents(count):
+    now = datetime.now(timezone.utc)
+    docs = []
+    for i in range(count):
+        source = SOURCES[i % len(SOURCES)]
+        month = 1 + i // len(SOURCES) % 12
+        docs.append(
+            {
+                "url": f"https://example.com/{i}",
+                "source": source,
+                "date": f"2024-{month:02d}-{1 + i % 28:02d}T08:00:00",
+                "title": f"Artículo {i}",
+                "subtitle": "Resumen del artículo",
+                "content": "Texto del artículo. " * 100,
+                "content_hash": f"{i:032x}",
+                "duplicate_cluster": None,
+                "cleaned": True,
+                "updated_at": now,
+            }
+        )
+    # Partitions that come back after other ones
+    extra = [
+        ("El Tiempo", None),
+        ("El Tiempo", "hace 2 horas"),
+        ("El País", "2024-01-15T08:00:00"),
+        ("El/País", "2024-01-16T08:00:00"),
+        ("El País", "2024-02-15T08:00:00"),
+    ]
+    for i, (source, date) in enumerate(extra, start=count):
+        doc = dict(docs[0], url=f"https://example.com/{i}", source=source, date=date)
+        docs.append(doc)
+    return docs
+
+
+def load(docs):
+    os.environ["MONGODB_DATABASE"] = "bench_export"
+    os.environ["MONGODB_COLLECTION"] = "articles"
+    collection = MemoryClient()["bench_export"]["articles"]
+    collection.docs = {i: dict(doc, _id=i) for i, doc in enumerate(docs)}
+
+
+def exported_urls(output, fmt):
+    urls = []
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        for path in glob.glob(os.path.join(output, "**", "*.parquet"), recursive=True):
+            urls.extend(pq.read_table(path, columns=["url"]).column("url").to_pylist())
+        return urls
+
+    import zstandard
+
+    for path in glob.glob(os.path.join(output, "**", "*.jsonl.zst"), recursive=True):
+        with open(path, "rb") as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(f)
+            for line in io.TextIOWrapper(reader, encoding="utf-8"):
+                urls.append(json.loads(line)["url"])
+    return urls
+
+
+def check_export(docs, output, fmt):
+    counts = Counter(exported_urls(output, fmt))
+    missing = [doc["url"] for doc in docs if doc["url"] not in counts]
+    repeated = [url for url, count in counts.items() if count > 1]
+    print(
+        f"Export ({fmt}): {len(counts)}/{len(docs)} documents, "
+        f"{len(missing)} missing, {len(repeated)} repeated"
+    )
+    for url in missing[:10]:
+        print(f"MISSING {url}")
+    return not missing and not repeated
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--format", choices=["parquet", "jsonl"], action="append")
+    args = parser.parse_args()
+
+    docs = documents(args.docs)
+    load(docs)
+    ok = True
+    for fmt in args.format or ["parquet", "jsonl"]:
+        output = tempfile.mkdtemp()
+        try:
+            started = time.perf_counter()
+            export_articles.export_articles(output, fmt=fmt)
+            seconds = time.perf_counter() - started
+            ok = check_export(docs, output, fmt) and ok
+            print(f"{fmt:>8}: {len(docs) / seconds:8.0f} docs/s, {seconds:.2f}s")
+        finally:
+            shutil.rmtree(output)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
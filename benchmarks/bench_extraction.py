@@ -0,0 +1,216 @@
+# Compares the precompiled extractors of extraction.py against the
+# response.css extraction the spiders' parse_article used before, and times
+# the JSON-LD path on the same pages with a NewsArticle block added. The old
+# extraction is copied below with its own selectors, so the check does not
+# depend on sources.json.
+#
+# Usage:
+#     python benchmarks/bench_extraction.py [--number N]
+#
+# The article fixture of every source is first checked for identical field
+# values, and every JSON-LD variant for being read from structured data
+# alone; the script exits with a non-zero status otherwise. Every run starts
+# from a fresh response, so HTML parsing is included.
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "..", "sesgocero_scrapper"))
+
+from scrapy.http import HtmlResponse  # noqa: E402
+
+from sesgocero_scrapper.extraction import EXTRACTORS  # noqa: E402
+
+SITES_DIR = os.path.join(ROOT, "fixtures", "sites")
+BASE = "https://example.com"
+
+
+def load_fixtures():
+    fixtures = []
+    for name in sorted(EXTRACTORS):
+        path = os.path.join(SITES_DIR, name, "article.html")
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            page = f.read().replace("__N__", "1").replace("__BASE__", BASE)
+        fixtures.append((name, page.encode("utf-8")))
+    return fixtures
+
+
+def with_structured_data(page, values):
+    # The page with a NewsArticle JSON-LD block holding the given values
+    article = {
+        "@context": "https://schema.org",
+        "@type": "NewsArticle",
+        "headline": values["title"],
+        "description": values["subtitle"],
+        "datePublished": "2025-04-14T10:32:00-05:00",
+        "articleBody": values["content"],
+    }
+    script = (
+        '<script type="application/ld+json">'
+        + json.dumps(article, ensure_ascii=False).replace("</", "<\\/")
+        + "</script>"
+    )
+    return page.replace(b"</head>", script.encode("utf-8") + b"</head>", 1)
+
+
+def response(body):
+    return HtmlResponse(f"{BASE}/article-1", body=body, encoding="utf-8")
+
+
+# The field extraction of each spider's parse_article before sources.json,
+# up to the date string it passed to parse_date
+
+
+def legacy_blu_radio(response):
+    content = " ".join(
+        response.css("div.RichTextArticleBody div.RichTextBody p::text").getall()
+    )
+    return {
+        "title": response.css("h1.ArticlePage-headline::text").get() or None,
+        "subtitle": response.css("h2.ArticlePage-subHeadline::text").get() or None,
+        "content": content or "No content found",
+        "date": response.css("div time::text").get(),
+    }
+
+
+def legacy_el_espectador(response):
+    content = " ".join(response.css("p.font--secondary::text").getall())
+    return {
+        "title": response.css("h1.ArticleHeader-Title::text").get() or None,
+        "subtitle": response.css("h2.ArticleHeader-Hook div::text").get() or None,
+        "content": content or "No content found",
+        "date": response.css("div.Datetime::text").get(),
+    }
+
+
+def legacy_el_pais(response):
+    content = " ".join(response.css("div.a_c p, div.a_c h2").getall())
+    return {
+        "title": response.css("h1.a_t::text").get() or None,
+        "subtitle": response.css("h2.a_st::text").get() or None,
+        "content": content or "No content found",
+        "date": response.css("div.a_md_f a::attr(data-date)").get(),
+    }
+
+
+def legacy_el_tiempo(response):
+    subtitle = " ".join(response.css("h2.c-lead__titulo::text").getall())
+    content = " ".join(response.css("div.paragraph").getall())
+    return {
+        "title": response.css("h1.c-articulo__titulo::text").get() or None,
+        "subtitle": subtitle or None,
+        "content": content or "No content found",
+        "date": response.css("span.c-articulo__autor__fecha span time::text").get(),
+    }
+
+
+def legacy_rcn(response):
+    content = " ".join(response.css("div.content p::text").getall())
+    return {
+        "title": response.css("h1.title::text").get() or None,
+        "subtitle": response.css("h2.lead::text").get() or None,
+        "content": content or "No content found",
+        "date": response.css("div.date span:first-child::text").get(),
+    }
+
+
+def legacy_silla_vacia(response):
+    content = " ".join(response.css("div.entry-content p::text").getall())
+    return {
+        "title": response.css("h1.entry-title::text").get() or None,
+        "subtitle": response.css("h2.entry-title::text").get() or None,
+        "content": content or "No content found",
+        "date": response.css("span.posted-on time.published::attr(datetime)").get(),
+    }
+
+
+LEGACY = {
+    "blu_radio": legacy_blu_radio,
+    "el_espectador": legacy_el_espectador,
+    "el_pais": legacy_el_pais,
+    "el_tiempo": legacy_el_tiempo,
+    "rcn": legacy_rcn,
+    "silla_vacia": legacy_silla_vacia,
+}
+
+
+def legacy_extract(name, response):
+    return LEGACY[name](response)
+
+
+def precompiled_extract(name, response):
+    return EXTRACTORS[name].extract(response.text)[0]
+
+
+def check_parity(fixtures):
+    failures = 0
+    for name, body in fixtures:
+        extractor = EXTRACTORS[name]
+        expected = legacy_extract(name, response(body))
+        actual, path = extractor.extract(response(body).text)
+        if actual != expected or path != "css":
+            failures += 1
+            print(f"MISMATCH {name}\n  css:      {expected!r}\n  compiled: {actual!r}")
+    print(f"Parity: {len(fixtures) - failures}/{len(fixtures)} sources match")
+    return failures == 0
+
+
+def structured_fixtures(fixtures):
+    variants = []
+    for name, body in fixtures:
+        values = legacy_extract(name, response(body))
+        variant = with_structured_data(body, {**values, "subtitle": "Resumen"})
+        path = EXTRACTORS[name].extract(response(variant).text)[1]
+        if path != "structured_data":
+            print(f"JSON-LD not used for {name}: {path}")
+            return None
+        variants.append((name, variant))
+    return variants
+
+
+def bench(func, fixtures, number):
+    def run():
+        for name, body in fixtures:
+            func(name, response(body))
+
+    return min(timeit.repeat(run, number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=500)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    if not check_parity(fixtures):
+        sys.exit(1)
+    variants = structured_fixtures(fixtures)
+    if variants is None:
+        sys.exit(1)
+
+    results = {}
+    for label, func, pages in [
+        ("css", legacy_extract, fixtures),
+        ("compiled", precompiled_extract, fixtures),
+        ("json-ld", precompiled_extract, variants),
+    ]:
+        seconds = bench(func, pages, args.number)
+        results[label] = seconds
+        print(
+            f"{label:>8}: {seconds * 1e6 / len(pages):8.1f} us per article, "
+            f"{len(pages) / seconds:8.0f} articles/s"
+        )
+    print(
+        f"Speedup: compiled {results['css'] / results['compiled']:.1f}x, "
+        f"json-ld {results['css'] / results['json-ld']:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
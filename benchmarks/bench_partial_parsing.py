@@ -0,0 +1,161 @@
+# Compares parsing the whole article page with the incremental parse that
+# stops once every required field has matched (PARTIAL_PARSING), on the
+# article fixtures padded with related-story markup after the body.
+#
+# Usage:
+#     python benchmarks/bench_partial_parsing.py [--page-kb N] [--number N]
+#
+# Every padded fixture is first checked for identical field values with and
+# without partial parsing, as is, and with every paragraph in a wrapper of
+# its own and a figure between them (div.entry-content > section > p); the
+# script exits with a non-zero status otherwise.
+# Memory is the RSS growth of a fresh process that parses one page of each
+# source and holds the trees (Linux only, read from /proc/self/statm).
+
+import argparse
+import re
+import resource
+import subprocess
+import sys
+import timeit
+
+from bench_extraction import EXTRACTORS, legacy_extract, load_fixtures, response
+from localsites import filler
+
+from sesgocero_scrapper.extraction import PARTIAL_CHUNK_SIZE, parse_html, parse_partial
+
+MODES = ("css", "full", "partial")
+
+PARAGRAPH = re.compile(r"<p\b.*?</p>", re.DOTALL)
+
+# Larger than the first chunks of the incremental parser, so the wrappers
+# after the first one arrive in later chunks
+FIGURE = (
+    "<figure><img src='foto.jpg'><figcaption>"
+    + "Foto de archivo. " * (PARTIAL_CHUNK_SIZE // 8)
+    + "</figcaption></figure>"
+)
+
+
+def interleave(page):
+    # The article body split across sibling wrappers: a joined field must
+    # not stop at the end of the first one
+    return PARAGRAPH.sub(
+        lambda match: f"<section>{match.group(0)}</section>{FIGURE}", page
+    )
+
+
+def padded_fixtures(page_kb, interleaved=False):
+    fixtures = []
+    for name, body in load_fixtures():
+        page = body.decode("utf-8")
+        if interleaved:
+            page = interleave(page)
+        padding = page_kb * 1024 - len(page)
+        if padding > 0:
+            page = page.replace("</body>", filler(name, padding) + "</body>")
+        fixtures.append((name, page))
+    return fixtures
+
+
+def parse(mode, name, page):
+    # The tree each mode builds for one page
+    extractor = EXTRACTORS[name]
+    if mode == "css":
+        return response(page.encode("utf-8")).selector.root
+    if mode == "full":
+        return parse_html(page)
+    fields = [extractor.fields[field] for field in extractor.required]
+    return parse_partial(page, fields)
+
+
+def extract(mode, name, page):
+    extractor = EXTRACTORS[name]
+    if mode == "css":
+        return legacy_extract(name, response(page.encode("utf-8")))
+    return extractor.extract(page, partial=mode == "partial")[0]
+
+
+def check_parity(fixtures, label):
+    failures = 0
+    for name, page in fixtures:
+        expected = extract("full", name, page)
+        actual = extract("partial", name, page)
+        if actual != expected:
+            failures += 1
+            print(f"MISMATCH {name}\n  full:    {expected!r}\n  partial: {actual!r}")
+    print(f"Parity ({label}): {len(fixtures) - failures}/{len(fixtures)} sources match")
+    return failures == 0
+
+
+def bench(mode, fixtures, number):
+    def run():
+        for name, page in fixtures:
+            extract(mode, name, page)
+
+    return min(timeit.repeat(run, number=number, repeat=5)) / number
+
+
+def tree_memory(mode, page_kb):
+    # Run in a child so every mode starts from the same heap
+    output = subprocess.run(
+        [sys.executable, __file__, "--page-kb", str(page_kb), "--memory", mode],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return [int(value) for value in output.split()]
+
+
+def resident_kb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+
+def measure_memory(mode, page_kb):
+    fixtures = padded_fixtures(page_kb)
+    before = resident_kb()
+    trees = [parse(mode, name, page) for name, page in fixtures]
+    after = resident_kb()
+    elements = sum(1 for root in trees for _ in root.iter())
+    print((after - before) // len(trees), elements // len(trees))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--page-kb", type=int, default=256)
+    parser.add_argument("--number", type=int, default=20)
+    parser.add_argument("--memory", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.memory:
+        measure_memory(args.memory, args.page_kb)
+        return
+
+    fixtures = padded_fixtures(args.page_kb)
+    interleaved = padded_fixtures(args.page_kb, interleaved=True)
+    if not all(
+        [
+            check_parity(fixtures, "as is"),
+            check_parity(interleaved, "interleaved wrappers"),
+        ]
+    ):
+        sys.exit(1)
+
+    results = {}
+    for mode in MODES:
+        seconds = bench(mode, fixtures, args.number)
+        results[mode] = seconds
+        memory, elements = tree_memory(mode, args.page_kb)
+        print(
+            f"{mode:>8}: {seconds * 1e3 / len(fixtures):8.2f} ms per article, "
+            f"{memory:8d} KiB per tree, {elements:6d} elements per tree"
+        )
+    print(
+        f"Speedup: partial {results['full'] / results['partial']:.1f}x over full, "
+        f"{results['css'] / results['partial']:.1f}x over css"
+    )
+
+
+if __name__ == "__main__":
+    main()
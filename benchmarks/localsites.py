@@ -0,0 +1,227 @@
+# Local stand-in for the news sites, used by bench_crawl.py.
+#
+# LocalSitesServer serves the listing and article fixtures of every source
+# from fixtures/sites/<spider>/, under /<real hostname>/<real path>, with
+# optional latency and error injection and listings split into pages of
+# per_page entries linked with rel="next". LocalSitesMiddleware rewrites the
+# spiders' start urls to that server and CrawlMetrics records per-spider
+# throughput and item latency.
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import os
+import random
+import re
+import threading
+import time
+
+from scrapy import signals
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SITES_DIR = os.path.join(ROOT, "fixtures", "sites")
+
+ARTICLE_PATH = re.compile(r"articulo-(\d+)")
+
+# Filled by CrawlMetrics when each spider closes
+RESULTS = {}
+
+
+def load_site(spider_name):
+    site = {}
+    for name in ["listing", "entry", "article"]:
+        with open(os.path.join(SITES_DIR, spider_name, f"{name}.html")) as f:
+            site[name] = f.read()
+    return site
+
+
+def filler(host, size):
+    # Navigation and related-story markup that real article pages carry
+    # around the article body
+    items = []
+    total = 0
+    i = 0
+    while total < size:
+        item = (
+            f'<li class="related__item"><a href="/{host}/relacionadas/{i}">'
+            f"Historia relacionada número {i}</a></li>\n"
+        )
+        items.append(item)
+        total += len(item)
+        i += 1
+    return f'<aside class="related"><ul>\n{"".join(items)}</ul></aside>\n'
+
+
+class LocalSitesServer:
+    def __init__(
+        self,
+        sites,
+        articles=50,
+        latency_ms=0,
+        jitter_ms=0,
+        error_rate=0.0,
+        page_kb=0,
+        per_page=0,
+    ):
+        # sites: {spider name: start url}
+        self.articles = articles
+        self.per_page = per_page or articles
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.page_kb = page_kb
+        self.sites = {}
+        for spider_name, start_url in sites.items():
+            parsed = urlparse(start_url)
+            self.sites[parsed.netloc] = (parsed.path or "/", load_site(spider_name))
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = server.render(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def render(self, path):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+        host, _, rest = path.lstrip("/").partition("/")
+        rest, _, query = ("/" + rest).partition("?")
+        if path == "/robots.txt" or rest == "/robots.txt":
+            return 200, b"User-agent: *\nAllow: /\n"
+        if host not in self.sites:
+            return 404, b"Not found"
+
+        listing_path, site = self.sites[host]
+        base = f"/{host}"
+        if rest == listing_path:
+            number = int(query[5:]) if query.startswith("page=") else 1
+            first = (number - 1) * self.per_page
+            last = min(self.articles, first + self.per_page)
+            entries = "\n".join(
+                site["entry"].replace("__N__", str(n)) for n in range(first, last)
+            )
+            page = site["listing"].replace("<!-- articles -->", entries)
+            if last < self.articles:
+                next_link = (
+                    f'<link rel="next" href="{base}{listing_path}?page={number + 1}">'
+                )
+                page = page.replace("</head>", next_link + "</head>")
+        else:
+            match = ARTICLE_PATH.search(rest)
+            if not match:
+                return 404, b"Not found"
+            if self.error_rate and random.random() < self.error_rate:
+                return 503, b"Service unavailable"
+            page = site["article"].replace("__N__", match.group(1))
+            padding = self.page_kb * 1024 - len(page)
+            if padding > 0:
+                page = page.replace("</body>", filler(host, padding) + "</body>")
+
+        return 200, page.replace("__BASE__", base).encode("utf-8")
+
+
+class LocalSitesMiddleware:
+    # Downloader middleware: send requests for the real sites to the local
+    # server instead
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.netloc = urlparse(base_url).netloc
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.get("LOCAL_SITES_URL"))
+
+    def process_request(self, request, spider):
+        parsed = urlparse(request.url)
+        if parsed.netloc == self.netloc:
+            return None
+        url = f"{self.base_url}/{parsed.netloc}{parsed.path or '/'}"
+        if parsed.query:
+            url += f"?{parsed.query}"
+        return request.replace(url=url)
+
+
+class CrawlMetrics:
+    # Extension: per-spider pages, items and item latency (from the moment
+    # the request that produced the item was scheduled until the item left
+    # the pipelines)
+
+    def __init__(self):
+        self.started = None
+        self.pages = 0
+        self.latencies = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls()
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        ext.stats = crawler.stats
+        return ext
+
+    def spider_opened(self, spider):
+        self.started = time.perf_counter()
+
+    def request_scheduled(self, request, spider):
+        request.meta.setdefault("bench_scheduled", time.perf_counter())
+
+    def response_received(self, response, request, spider):
+        self.pages += 1
+
+    def item_scraped(self, item, response, spider):
+        scheduled = response.request.meta.get("bench_scheduled")
+        if scheduled is not None:
+            self.latencies.append(time.perf_counter() - scheduled)
+
+    def spider_closed(self, spider, reason):
+        elapsed = time.perf_counter() - self.started
+        RESULTS[spider.name] = {
+            "elapsed_s": elapsed,
+            "pages": self.pages,
+            "items": len(self.latencies),
+            "pages_per_s": self.pages / elapsed if elapsed else 0.0,
+            "items_per_s": len(self.latencies) / elapsed if elapsed else 0.0,
+            "item_latency_ms": latency_percentiles(self.latencies),
+            "finish_reason": reason,
+            "stats": {
+                k: v
+                for k, v in self.stats.get_stats(spider).items()
+                if isinstance(v, (int, float, str))
+            },
+        }
+
+
+def latency_percentiles(latencies):
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(latencies)
+
+    def rank(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+
+    return {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99)}
@@ -0,0 +1,194 @@
+# In-memory stand-in for the small part of pymongo the project uses, so the
+# crawl benchmark can run without a MongoDB server. Only what the pipeline
+# and middlewares call is implemented: unique indexes, update_one/bulk_write
+# with $set / $currentDate upserts, find with simple queries and sorts, the
+# hello command, and close.
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import itertools
+import threading
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in cond):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(cond, dict) and cond and next(iter(cond)).startswith("$"):
+            for op, arg in cond.items():
+                if op == "$ne" and value == arg:
+                    return False
+                if op == "$exists" and (key in doc) != bool(arg):
+                    return False
+                if op == "$in" and value not in arg:
+                    return False
+                if op in ("$lt", "$lte", "$gt", "$gte"):
+                    if value is None:
+                        return False
+                    if op == "$lt" and not value < arg:
+                        return False
+                    if op == "$lte" and not value <= arg:
+                        return False
+                    if op == "$gt" and not value > arg:
+                        return False
+                    if op == "$gte" and not value >= arg:
+                        return False
+        elif value != cond:
+            return False
+    return True
+
+
+def bson_order(value):
+    # Sort key following MongoDB's order across types: null (and missing)
+    # first, then numbers, strings, booleans and dates
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (3, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return (4, value)
+    return (5, str(value))
+
+
+class MemoryCollection:
+    def __init__(self):
+        self.docs = {}
+        # Unique indexes: field -> {value: _id}
+        self.unique = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def create_index(self, keys, unique=False, **kwargs):
+        if unique and isinstance(keys, str) and keys not in self.unique:
+            self.unique[keys] = {
+                doc[keys]: _id for _id, doc in self.docs.items() if keys in doc
+            }
+        return keys if isinstance(keys, str) else "_".join(k for k, _ in keys)
+
+    def find(self, query=None, projection=None, sort=None, **kwargs):
+        with self.lock:
+            docs = [doc for doc in self.docs.values() if matches(doc, query or {})]
+        # Stable sorts from the last key to the first
+        for key, direction in reversed(sort or []):
+            docs.sort(key=lambda doc: bson_order(doc.get(key)), reverse=direction < 0)
+        for doc in docs:
+            if projection:
+                fields = [k for k, v in projection.items() if v and k != "_id"]
+                if fields:
+                    doc = {k: doc[k] for k in fields if k in doc}
+                else:
+                    # Only exclusions, such as {"_id": 0}
+                    doc = {k: v for k, v in doc.items() if k not in projection}
+            yield dict(doc)
+
+    def find_one(self, query=None, projection=None):
+        return next(self.find(query, projection), None)
+
+    def count_documents(self, query):
+        return sum(1 for _ in self.find(query))
+
+    def candidates(self, query):
+        for field, index in self.unique.items():
+            value = query.get(field)
+            if value is not None and not isinstance(value, dict):
+                _id = index.get(value)
+                return [self.docs[_id]] if _id is not None else []
+        return self.docs.values()
+
+    def _update(self, query, update, upsert):
+        values = dict(update.get("$set", {}))
+        now = datetime.now(timezone.utc)
+        values.update({k: now for k in update.get("$currentDate", {})})
+        for doc in self.candidates(query):
+            if matches(doc, query):
+                changed = any(doc.get(k) != v for k, v in values.items())
+                doc.update(values)
+                return SimpleNamespace(
+                    upserted_id=None, matched_count=1, modified_count=int(changed)
+                )
+
+        if not upsert:
+            return SimpleNamespace(upserted_id=None, matched_count=0, modified_count=0)
+
+        doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+        doc.update(values)
+        for field, index in self.unique.items():
+            if doc.get(field) in index:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error: {field}", DUPLICATE_KEY_ERROR
+                )
+        doc["_id"] = next(self.ids)
+        self.docs[doc["_id"]] = doc
+        for field, index in self.unique.items():
+            if field in doc:
+                index[doc[field]] = doc["_id"]
+        return SimpleNamespace(
+            upserted_id=doc["_id"], matched_count=0, modified_count=0
+        )
+
+    def update_one(self, query, update, upsert=False):
+        with self.lock:
+            return self._update(query, update, upsert)
+
+    def bulk_write(self, operations, ordered=True):
+        details = {"nUpserted": 0, "nModified": 0, "nMatched": 0, "writeErrors": []}
+        with self.lock:
+            for index, op in enumerate(operations):
+                try:
+                    result = self._update(op._filter, op._doc, op._upsert)
+                except DuplicateKeyError as e:
+                    details["writeErrors"].append(
+                        {"index": index, "code": e.code, "errmsg": str(e)}
+                    )
+                    if ordered:
+                        break
+                    continue
+                details["nUpserted"] += int(result.upserted_id is not None)
+                details["nModified"] += result.modified_count
+                details["nMatched"] += result.matched_count
+        if details["writeErrors"]:
+            raise BulkWriteError(details)
+        return SimpleNamespace(bulk_api_result=details)
+
+
+class MemoryDatabase(dict):
+    def __missing__(self, name):
+        collection = self[name] = MemoryCollection()
+        return collection
+
+
+class MemoryClient:
+    # Every client sees the same data, like clients of one server
+    databases = {}
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getitem__(self, name):
+        return self.databases.setdefault(name, MemoryDatabase())
+
+    @property
+    def admin(self):
+        return self
+
+    def command(self, name):
+        if name != "hello":
+            raise NotImplementedError(name)
+        # localTime comes back without a tzinfo, as from pymongo
+        return {"localTime": datetime.now(timezone.utc).replace(tzinfo=None)}
+
+    def close(self):
+        pass
@@ -0,0 +1,257 @@
+from pymongo import MongoClient
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import re
+import time
+from dotenv import load_dotenv
+
+# Optional: only needed for the format that uses them
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MONTH = re.compile(r"^(\d{4}-\d{2})")
+
+WATERMARK_FILE = "_watermark.json"
+
+
+def parquet_schema():
+    # Fixed schema so every partition and every incremental run agree
+    return pa.schema(
+        [
+            ("url", pa.string()),
+            ("source", pa.string()),
+            ("date", pa.string()),
+            ("title", pa.string()),
+            ("subtitle", pa.string()),
+            ("content", pa.string()),
+            ("content_hash", pa.string()),
+            ("duplicate_cluster", pa.string()),
+            ("cleaned", pa.bool_()),
+            ("updated_at", pa.timestamp("ms", tz="UTC")),
+        ]
+    )
+
+
+def partition(doc):
+    date = doc.get("date")
+    match = MONTH.match(date) if isinstance(date, str) else None
+    return doc.get("source") or "unknown", match.group(1) if match else "unknown"
+
+
+def safe_name(value):
+    return re.sub(r"[^\w.-]+", "_", value)
+
+
+class ParquetPartition:
+    def __init__(self, path, compression_level):
+        self.writer = pq.ParquetWriter(
+            path,
+            parquet_schema(),
+            compression="zstd",
+            compression_level=compression_level,
+        )
+
+    def write(self, docs):
+        if not docs:
+            return
+        # One row group per batch
+        schema = self.writer.schema
+        columns = {name: [doc.get(name) for doc in docs] for name in schema.names}
+        self.writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class JsonlPartition:
+    def __init__(self, path, compression_level):
+        self.file = open(path, "wb")
+        self.stream = zstandard.ZstdCompressor(level=compression_level).stream_writer(
+            self.file
+        )
+
+    def write(self, docs):
+        if not docs:
+            return
+        lines = "".join(
+            json.dumps(doc, ensure_ascii=False, default=str) + "\n" for doc in docs
+        )
+        self.stream.write(lines.encode("utf-8"))
+
+    def close(self):
+        self.stream.close()
+        self.file.close()
+
+
+def read_watermark(output):
+    path = os.path.join(output, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return datetime.fromisoformat(json.load(f)["updated_at"])
+
+
+def write_watermark(output, started):
+    path = os.path.join(output, WATERMARK_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"updated_at": started.isoformat()}, f)
+    os.replace(path + ".tmp", path)
+
+
+def server_time(client):
+    # hello.localTime is the server's UTC clock, returned without a tzinfo
+    local_time = client.admin.command("hello")["localTime"]
+    return local_time.replace(tzinfo=timezone.utc)
+
+
+def print_progress(exported, files, started):
+    elapsed = time.perf_counter() - started
+    rate = exported / elapsed if elapsed else 0.0
+    print(
+        f"{exported} documents in {files} files ({rate:.0f} docs/s, {elapsed:.1f}s)",
+        flush=True,
+    )
+
+
+def export_articles(
+    output, fmt="parquet", incremental=False, batch_size=5000, compression_level=3
+):
+    if fmt == "parquet" and pq is None:
+        raise SystemExit("Parquet export needs pyarrow: pip install pyarrow")
+    if fmt == "jsonl" and zstandard is None:
+        raise SystemExit("JSONL export needs zstandard: pip install zstandard")
+    partition_cls = ParquetPartition if fmt == "parquet" else JsonlPartition
+    extension = "parquet" if fmt == "parquet" else "jsonl.zst"
+
+    # Load environment variables
+    load_dotenv()
+
+    # Connect to MongoDB
+    client = MongoClient(os.getenv("MONGODB_URI"))
+
+    # Get database and collection
+    db = client[os.getenv("MONGODB_DATABASE", "sesgocero")]
+    collection = db[os.getenv("MONGODB_COLLECTION", "articles")]
+
+    os.makedirs(output, exist_ok=True)
+    # Everything written from this moment on is picked up by the next
+    # incremental export; documents written during this one may appear in
+    # both, never in neither. updated_at is set by the server ($currentDate),
+    # so the watermark is the server's clock too: with the local one, a
+    # clock ahead of the server would skip the documents written in between.
+    export_started = server_time(client)
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+
+    query = {}
+    watermark = read_watermark(output) if incremental else None
+    if watermark is not None:
+        query = {"updated_at": {"$gte": watermark}}
+        print(f"Exporting documents changed since {watermark.isoformat()}")
+
+    # Sorted by partition, so only one file is open at a time and memory
+    # does not grow with the number of sources and months
+    cursor = collection.find(
+        query,
+        {"_id": 0},
+        sort=[("source", 1), ("date", 1)],
+        batch_size=batch_size,
+        allow_disk_use=True,
+    )
+
+    started = time.perf_counter()
+    last_report = started
+    exported = 0
+    files = 0
+    # Part files opened per directory. The sort is on the raw values, so a
+    # partition can come back later: a null date sorts before the ISO
+    # strings and a BSON date after them, all of them in month=unknown, and
+    # safe_name can map two sources to one directory. Each return gets a
+    # file of its own instead of truncating the previous one.
+    parts = {}
+    current = None
+    writer = None
+    batch = []
+    try:
+        for doc in cursor:
+            key = partition(doc)
+            if key != current:
+                if writer is not None:
+                    writer.write(batch)
+                    writer.close()
+                batch = []
+                source, month = key
+                directory = os.path.join(
+                    output, f"source={safe_name(source)}", f"month={month}"
+                )
+                os.makedirs(directory, exist_ok=True)
+                part = parts.get(directory, 0)
+                parts[directory] = part + 1
+                writer = partition_cls(
+                    os.path.join(directory, f"part-{run_id}-{part}.{extension}"),
+                    compression_level,
+                )
+                current = key
+                files += 1
+
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                writer.write(batch)
+                batch = []
+            exported += 1
+
+            now = time.perf_counter()
+            if now - last_report >= 5:
+                print_progress(exported, files, started)
+                last_report = now
+
+        if writer is not None:
+            writer.write(batch)
+            writer.close()
+            writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+        cursor.close()
+        client.close()
+
+    write_watermark(output, export_started)
+    print_progress(exported, files, started)
+    print("Export completed!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the articles collection, partitioned by source and "
+        "month of date"
+    )
+    parser.add_argument("output", help="output directory")
+    parser.add_argument(
+        "--format",
+        choices=["parquet", "jsonl"],
+        default="parquet",
+        help="Parquet (needs pyarrow) or zstd-compressed JSONL (needs zstandard)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="export only documents changed since the last export to OUTPUT",
+    )
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--compression-level", type=int, default=3)
+    args = parser.parse_args()
+    export_articles(
+        args.output,
+        fmt=args.format,
+        incremental=args.incremental,
+        batch_size=args.batch_size,
+        compression_level=args.compression_level,
+    )
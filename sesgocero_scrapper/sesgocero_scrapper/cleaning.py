@@ -0,0 +1,90 @@
+from bs4 import BeautifulSoup
+from html.entities import name2codepoint
+from lxml import etree
+import re
+
+WHITESPACE = re.compile(r"\s+")
+
+# Campos de texto de un artículo que se limpian antes de guardarlo
+CLEANED_FIELDS = ("title", "subtitle", "content")
+
+# Texto que BeautifulSoup no considera contenido: comentarios, scripts,
+# estilos y plantillas
+TEXT_NODES = etree.XPath(
+    "//text()[not(ancestor::script or ancestor::style or ancestor::template)]"
+)
+
+# lxml solo conoce las entidades de HTML 4 y trata distinto las referencias
+# sueltas ("AT&T"); esos textos se limpian con BeautifulSoup
+ENTITY_REFERENCE = re.compile(r"&([A-Za-z][A-Za-z0-9]*)(;?)")
+
+# Marcado que html.parser conserva o lee distinto que lxml: un "<" que no
+# abre una etiqueta ni un comentario ("a < b", "</ p>"), secciones CDATA y
+# caracteres NUL; esos textos también se limpian con BeautifulSoup
+LITERAL_MARKUP = re.compile(r"<(?![A-Za-z]|/[A-Za-z]|!)|<!\[CDATA\[|\x00")
+
+
+def normalize_text(text):
+    if not text:
+        return ""
+    return WHITESPACE.sub(" ", text.strip())
+
+
+def clean_html_bs(text):
+    if not text:
+        return ""
+    soup = BeautifulSoup(text, "html.parser")
+    cleaned = soup.get_text(separator=" ", strip=True)
+    return WHITESPACE.sub(" ", cleaned)
+
+
+def has_unknown_entities(text):
+    for name, semicolon in ENTITY_REFERENCE.findall(text):
+        if not semicolon or name not in name2codepoint:
+            return True
+    return False
+
+
+def has_literal_markup(text):
+    # También una etiqueta sin cerrar al final ("a<b"): html.parser la deja
+    # como texto y lxml la descarta
+    return LITERAL_MARKUP.search(text) is not None or text.rfind("<") > text.rfind(">")
+
+
+def clean_html(text):
+    if not text:
+        return ""
+
+    # Texto plano: basta con normalizar espacios
+    if "<" not in text and "&" not in text:
+        return WHITESPACE.sub(" ", text.strip())
+
+    if "&" in text and has_unknown_entities(text):
+        return clean_html_bs(text)
+
+    if has_literal_markup(text):
+        return clean_html_bs(text)
+
+    # El HTML que llega de parsel ya fue serializado por lxml, así que el
+    # árbol coincide con el de html.parser salvo en anidaciones inválidas
+    try:
+        root = etree.HTML(text)
+    except (ValueError, etree.ParserError):
+        return clean_html_bs(text)
+    if root is None:
+        return ""
+
+    cleaned = " ".join(s.strip() for s in TEXT_NODES(root) if s.strip())
+    return WHITESPACE.sub(" ", cleaned)
+
+
+def clean_item(adapter):
+    # Limpia los campos de texto del artículo una sola vez: el primero que
+    # lo limpia lo marca con cleaned y los demás lo reciben listo
+    if adapter.get("cleaned"):
+        return False
+    for field in CLEANED_FIELDS:
+        if adapter.get(field):
+            adapter[field] = normalize_text(clean_html(adapter[field]))
+    adapter["cleaned"] = True
+    return True
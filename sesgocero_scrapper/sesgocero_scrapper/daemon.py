@@ -0,0 +1,172 @@
+# Resident crawl scheduler
+#
+# `python run_all_spiders.py --daemon` keeps one process and one reactor
+# running and crawls every source again and again, each on its own
+# schedule, instead of starting a fresh process from cron for every run.
+# Imports, the reactor, the MongoDB client (see storage.py), the set of
+# stored article urls (see KnownUrlsMiddleware) and the robots.txt of every
+# site (see SharedRobotsTxtMiddleware) carry over from one crawl to the next.
+#
+# The interval of a source follows how often it publishes. The new articles
+# each crawl stored (mongodb/items/inserted) over the time since the
+# previous crawl feed an exponentially weighted rate, and the next crawl is
+# scheduled for when DAEMON_TARGET_NEW new articles are expected. Intervals
+# stay within DAEMON_MIN_INTERVAL and DAEMON_MAX_INTERVAL seconds and at
+# most double from one crawl to the next, so a quiet hour does not push a
+# busy source to the maximum at once. The learned rates are kept in a
+# SQLite file under .scrapy/ (DAEMON_DB) across restarts.
+
+import logging
+import os
+import sqlite3
+import time
+
+from scrapy.utils.project import data_path
+
+from .storage import MongoStorage
+
+logger = logging.getLogger(__name__)
+
+
+class PollSchedule:
+    def __init__(
+        self,
+        interval,
+        min_interval=300,
+        max_interval=21600,
+        target_new=5,
+        smoothing=0.3,
+        rate=None,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_new = target_new
+        self.smoothing = smoothing
+        self.interval = min(max(interval, min_interval), max_interval)
+        # New articles per second, None until two crawls have run
+        self.rate = rate
+        self.last_started = None
+
+    def update(self, new, started):
+        # Record a crawl that started at started (time.time()) and stored
+        # new articles; returns the seconds until the next one
+        previous, self.last_started = self.last_started, started
+        if previous is None or started <= previous:
+            # The first crawl also picks up whatever was published before
+            # it, which says nothing about the rate
+            return self.interval
+
+        observed = new / (started - previous)
+        if self.rate is None:
+            self.rate = observed
+        else:
+            self.rate = self.smoothing * observed + (1 - self.smoothing) * self.rate
+
+        interval = self.max_interval
+        if self.rate > 0:
+            interval = self.target_new / self.rate
+        interval = min(interval, self.interval * 2)
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        return self.interval
+
+
+class ScheduleStore:
+    # Interval and publishing rate of every source, in a SQLite file under
+    # .scrapy/
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS schedules "
+            "(source TEXT PRIMARY KEY, interval REAL, rate REAL)"
+        )
+        self.db.commit()
+
+    def get(self, source):
+        return self.db.execute(
+            "SELECT interval, rate FROM schedules WHERE source = ?", (source,)
+        ).fetchone()
+
+    def set(self, source, interval, rate):
+        self.db.execute(
+            "INSERT OR REPLACE INTO schedules VALUES (?, ?, ?)",
+            (source, interval, rate),
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class CrawlDaemon:
+    def __init__(self, process, spider_names, settings):
+        self.process = process
+        self.store = ScheduleStore(data_path(settings.get("DAEMON_DB", "daemon.db")))
+        # KnownUrls by KNOWN_URLS_REFETCH_DAYS, handed to every crawl so the
+        # stored urls are not read from MongoDB again on each one
+        self.known_urls = {}
+        self.schedules = {}
+        for name in spider_names:
+            interval = settings.getfloat("DAEMON_INTERVAL", 900)
+            rate = None
+            saved = self.store.get(name)
+            if saved is not None:
+                interval, rate = saved
+            self.schedules[name] = PollSchedule(
+                interval,
+                min_interval=settings.getfloat("DAEMON_MIN_INTERVAL", 300),
+                max_interval=settings.getfloat("DAEMON_MAX_INTERVAL", 21600),
+                target_new=settings.getfloat("DAEMON_TARGET_NEW", 5),
+                smoothing=settings.getfloat("DAEMON_SMOOTHING", 0.3),
+                rate=rate,
+            )
+
+    def start(self):
+        # Every source is crawled once the reactor runs, then on its own
+        # schedule until the process is interrupted. The first crawler
+        # installs the reactor of the settings, so it is imported after.
+        for name in self.schedules:
+            self.crawl(name)
+
+        from twisted.internet import reactor
+
+        # Held for the life of the daemon, so the MongoDB client and its
+        # pools stay open between crawls
+        storage = MongoStorage.acquire()
+        reactor.addSystemEventTrigger("after", "shutdown", storage.release)
+        reactor.addSystemEventTrigger("after", "shutdown", self.store.close)
+
+    def crawl(self, name):
+        crawler = self.process.create_crawler(name)
+        started = time.time()
+        d = self.process.crawl(crawler, known_urls=self.known_urls)
+        d.addBoth(self.crawled, name, crawler, started)
+
+    def crawled(self, result, name, crawler, started):
+        from twisted.internet import reactor
+
+        stats = crawler.stats.get_stats()
+        schedule = self.schedules[name]
+        if stats.get("finish_reason") == "shutdown":
+            return None
+        if stats.get("finish_reason") == "finished":
+            new = stats.get("mongodb/items/inserted", 0)
+            interval = schedule.update(new, started)
+            self.store.set(name, schedule.interval, schedule.rate)
+        else:
+            # A failed crawl says nothing about the source; retry on the
+            # current schedule
+            new = 0
+            interval = schedule.interval
+            logger.error(
+                "Crawl of %s did not finish: %s",
+                name,
+                stats.get("finish_reason") or result,
+            )
+        logger.info(
+            "Crawled %s: %d new articles, next crawl in %d s", name, new, interval
+        )
+        reactor.callLater(interval, self.crawl, name)
+        return None
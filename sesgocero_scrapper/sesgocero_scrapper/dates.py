@@ -0,0 +1,101 @@
+# Shared parser for the date strings published by the news sites
+
+from datetime import datetime
+import re
+
+MONTHS = {
+    "enero": 1,
+    "febrero": 2,
+    "marzo": 3,
+    "abril": 4,
+    "mayo": 5,
+    "junio": 6,
+    "julio": 7,
+    "agosto": 8,
+    "septiembre": 9,
+    "setiembre": 9,
+    "octubre": 10,
+    "noviembre": 11,
+    "diciembre": 12,
+    # Abbreviations used in bylines
+    "ene": 1,
+    "feb": 2,
+    "mar": 3,
+    "abr": 4,
+    "may": 5,
+    "jun": 6,
+    "jul": 7,
+    "ago": 8,
+    "sep": 9,
+    "sept": 9,
+    "oct": 10,
+    "nov": 11,
+    "dic": 12,
+}
+
+# "14 de abril de 2025", "14 de abril, 2025", "14 abr. 2025"
+DAY_MONTH_YEAR = re.compile(
+    r"(\d{1,2})\s+(?:de\s+)?([a-z]+)\.?(?:\s+de\s+|\s*,\s*|\s+)(\d{4})"
+)
+
+# "abril 14 de 2025", "abril 14, 2025"
+MONTH_DAY_YEAR = re.compile(r"([a-z]+)\.?\s+(\d{1,2})(?:\s+de\s+|\s*,\s*)(\d{4})")
+
+# "14.04.2025", "14/04/2025", "14-04-2025"
+NUMERIC = re.compile(r"(\d{1,2})[./-](\d{1,2})[./-](\d{4})")
+
+# "10:30", "10:30:15", "10:30 a. m.", "3:05 p.m."
+TIME = re.compile(r"(\d{1,2}):(\d{2})(?::(\d{2}))?(?:\s*([ap])\.?\s*m\b\.?)?")
+
+
+def parse_time(text):
+    match = TIME.search(text)
+    if not match:
+        return 0, 0, 0
+
+    hour, minute, second, meridiem = match.groups()
+    hour = int(hour)
+    if meridiem == "a" and hour == 12:
+        hour = 0
+    elif meridiem == "p" and hour < 12:
+        hour += 12
+    return hour, int(minute), int(second or 0)
+
+
+def parse_date(date_str):
+    """Parse a Spanish or ISO 8601 date string, keeping time and time zone"""
+    if not date_str:
+        return None
+
+    date_str = date_str.strip()
+
+    # ISO 8601, with or without time and offset ("2025-04-14T10:30:00-05:00")
+    if date_str[:4].isdigit() and date_str[4:5] == "-":
+        try:
+            return datetime.fromisoformat(date_str)
+        except ValueError:
+            pass
+
+    text = date_str.lower()
+    day = month = year = None
+
+    match = DAY_MONTH_YEAR.search(text)
+    if match and match.group(2) in MONTHS:
+        day, month, year = match.group(1), MONTHS[match.group(2)], match.group(3)
+    else:
+        match = MONTH_DAY_YEAR.search(text)
+        if match and match.group(1) in MONTHS:
+            month, day, year = MONTHS[match.group(1)], match.group(2), match.group(3)
+        else:
+            match = NUMERIC.search(text)
+            if match:
+                day, month, year = match.groups()
+
+    if match is None or day is None:
+        return None
+
+    hour, minute, second = parse_time(text[match.end() :])
+    try:
+        return datetime(int(year), int(month), int(day), hour, minute, second)
+    except ValueError:
+        return None
@@ -0,0 +1,199 @@
+# Article discovery from sitemaps and RSS/Atom feeds
+#
+# Spiders that mix in FeedDiscoveryMixin can find their articles in the
+# sitemaps and feeds a site publishes instead of its HTML listing pages. Run
+# them with DISCOVERY_MODE = "feeds" or `scrapy crawl <spider> -a
+# discovery=feeds`. Only entries whose lastmod / pubDate is newer than the
+# start of the last successful feeds run of that source are requested.
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from io import BytesIO
+from urllib.parse import urljoin
+import os
+import sqlite3
+import time
+
+from lxml import etree
+from scrapy import Request
+from scrapy.utils.gz import gunzip
+from scrapy.utils.project import data_path
+from scrapy.utils.sitemap import sitemap_urls_from_robots
+
+# Entry elements and the children holding their url and date, by local name
+ENTRY_TAGS = {
+    "url": ("article", ("loc",), ("publication_date", "lastmod")),
+    "sitemap": ("sitemap", ("loc",), ("lastmod",)),
+    "item": ("article", ("link",), ("pubDate", "date")),
+    "entry": ("article", ("link",), ("published", "updated")),
+}
+
+
+def local_name(tag):
+    return tag.rpartition("}")[2]
+
+
+def parse_feed_date(value):
+    # W3C datetime (sitemaps, Atom) or RFC 822 (RSS); naive dates are UTC
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date
+
+
+def entry_fields(elem, url_names, date_names):
+    url = None
+    dates = {}
+    for child in elem.iter():
+        if not isinstance(child.tag, str) or child is elem:
+            continue
+        name = local_name(child.tag)
+        if url is None and name in url_names:
+            # Atom puts the url in href, everything else in the text
+            url = (child.get("href") or child.text or "").strip() or None
+        elif name in date_names and name not in dates:
+            dates[name] = child.text
+    for name in date_names:
+        date = parse_feed_date(dates.get(name))
+        if date is not None:
+            return url, date
+    return url, None
+
+
+def iter_feed_entries(body):
+    # Yields (kind, url, date) for every entry of a sitemap, sitemap index,
+    # RSS or Atom document; kind is "sitemap" for sitemap index entries and
+    # "article" otherwise. Elements are cleared once read so memory stays
+    # flat however large the document is.
+    if body[:3] == b"\x1f\x8b\x08":
+        body = gunzip(body)
+    events = etree.iterparse(
+        BytesIO(body),
+        events=("end",),
+        recover=True,
+        resolve_entities=False,
+        huge_tree=True,
+    )
+    try:
+        for _, elem in events:
+            if not isinstance(elem.tag, str):
+                continue
+            spec = ENTRY_TAGS.get(local_name(elem.tag))
+            if spec is None:
+                continue
+            kind, url_names, date_names = spec
+            url, date = entry_fields(elem, url_names, date_names)
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+            if url:
+                yield kind, url, date
+    except etree.XMLSyntaxError:
+        return
+
+
+class LastRunStore:
+    # Start time of the last successful feeds run of every source, in a
+    # SQLite file under .scrapy/
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS last_runs (source TEXT PRIMARY KEY, started REAL)"
+        )
+        self.db.commit()
+
+    def get(self, source):
+        row = self.db.execute(
+            "SELECT started FROM last_runs WHERE source = ?", (source,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, source, started):
+        self.db.execute(
+            "INSERT OR REPLACE INTO last_runs VALUES (?, ?)", (source, started)
+        )
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class FeedDiscoveryMixin:
+    # Sitemaps and feeds to read in feeds mode. Without them the Sitemap:
+    # lines of the site's robots.txt are used.
+    feed_urls = []
+
+    def discovery_mode(self):
+        return getattr(self, "discovery", None) or self.settings.get(
+            "DISCOVERY_MODE", "listing"
+        )
+
+    def start_requests(self):
+        if self.discovery_mode() != "feeds":
+            yield from super().start_requests()
+            return
+
+        self.discovery_store = LastRunStore(
+            data_path(self.settings.get("DISCOVERY_DB", "discovery.db"))
+        )
+        self.discovery_started = time.time()
+        last_run = self.discovery_store.get(self.name)
+        self.discovery_since = None
+        if last_run is not None:
+            self.discovery_since = last_run - self.settings.getfloat(
+                "DISCOVERY_OVERLAP", 3600
+            )
+            self.logger.info(
+                "Discovering articles newer than %s",
+                datetime.fromtimestamp(self.discovery_since, timezone.utc).isoformat(),
+            )
+
+        feed_urls = self.feed_urls or [urljoin(self.start_urls[0], "/robots.txt")]
+        for url in feed_urls:
+            yield Request(url, callback=self.parse_feed)
+
+    def parse_feed(self, response):
+        stats = self.crawler.stats
+        if response.url.endswith("/robots.txt"):
+            for url in sitemap_urls_from_robots(response.text, base_url=response.url):
+                yield Request(url, callback=self.parse_feed)
+            return
+
+        stats.inc_value("discovery/feeds", spider=self)
+        for kind, url, date in iter_feed_entries(response.body):
+            stats.inc_value("discovery/entries", spider=self)
+            # Entries without a date cannot be ruled out
+            if (
+                date is not None
+                and self.discovery_since is not None
+                and date.timestamp() <= self.discovery_since
+            ):
+                stats.inc_value("discovery/stale", spider=self)
+                continue
+            if kind == "sitemap":
+                yield response.follow(url, callback=self.parse_feed)
+            else:
+                stats.inc_value("discovery/fresh", spider=self)
+                yield response.follow(url, callback=self.parse_article)
+
+    def closed(self, reason):
+        store = getattr(self, "discovery_store", None)
+        if store is None:
+            return
+        # The start time, so articles published during this run are read
+        # again next time
+        if reason == "finished":
+            store.set(self.name, self.discovery_started)
+        store.close()
@@ -0,0 +1,443 @@
+# Declarative article extraction
+#
+# Every source is an entry of sources.json: its start urls, the selector of
+# the article links on its listing pages and, for each article field, a list
+# of CSS selectors tried in order. A field takes the first value of the
+# first selector that matches, all of its values joined with spaces when
+# "join" is set, or "default" when none matches. "required" lists the fields
+# an article is not saved without; "date_format", an optional strptime
+# format tried before the shared date parser. Optional "next_page" and
+# "feeds" set the spider's next_page_selector and feed_urls.
+#
+# Before any selector runs, the schema.org NewsArticle most outlets embed as
+# JSON-LD is read: headline, description, datePublished (with its offset)
+# and articleBody. It is found with a regex over the page text, so when it
+# holds every field no tree is built at all; the selectors only fill the
+# fields it lacks. Set "structured_data" to false to skip it for a source.
+#
+# With PARTIAL_PARSING the page is fed to an incremental parser that stops
+# once every required field has matched and the elements holding the
+# matches have ended (for joined fields, the element the first part of the
+# selector matches, e.g. the div.entry-content of
+# "div.entry-content > section > p"), so the markup after the article body
+# (related stories, footers) never becomes part of the tree. Joined fields
+# whose selector has no container part are taken from the whole page. Optional fields that
+# only appear after that point are lost, hence opt-in.
+#
+# With PARSE_OFFLOAD_ENABLED the page goes to a worker process instead (see
+# offload.py), which also cleans the text fields; process_article is what
+# runs there.
+#
+# The selectors are translated to XPath and compiled once, when this module
+# is imported, and run directly on the lxml tree instead of going through
+# response.css, which compiles the XPath again and wraps every match in a
+# Selector on each call. Sources without a module of their own in spiders/
+# get a spider generated from their entry (see spiders/configured.py).
+
+from datetime import datetime
+from html import unescape
+from urllib.parse import urljoin
+import json
+import os
+import re
+
+from cssselect import parse as parse_css
+from cssselect.parser import CombinedSelector
+from lxml import etree, html
+from parsel.csstranslator import HTMLTranslator
+from scrapy.utils.defer import maybe_deferred_to_future
+import scrapy
+
+from .cleaning import CLEANED_FIELDS, clean_html, normalize_text
+from .dates import parse_date
+from .discovery import FeedDiscoveryMixin
+from .items import NewsItem
+from .metrics import check_required
+from .offload import parse_offload
+from .pagination import next_page_request
+
+SOURCES_FILE = os.path.join(os.path.dirname(__file__), "sources.json")
+
+translator = HTMLTranslator()
+
+# ::text and ::attr() matches live in the element the rest of the selector
+# matches
+PSEUDO_ELEMENT = re.compile(r"::(?:text|attr\([^)]*\))")
+
+# Bytes fed to the incremental parser between checks
+PARTIAL_CHUNK_SIZE = 16384
+
+JSONLD = re.compile(
+    r"<script[^>]*type=[\"']application/ld\+json[\"'][^>]*>(.*?)</script>",
+    re.IGNORECASE | re.DOTALL,
+)
+
+ARTICLE_TYPES = {
+    "Article",
+    "NewsArticle",
+    "ReportageNewsArticle",
+    "AnalysisNewsArticle",
+    "OpinionNewsArticle",
+    "BackgroundNewsArticle",
+    "ReviewNewsArticle",
+    "LiveBlogPosting",
+    "BlogPosting",
+}
+
+# schema.org properties read into each field, in order of preference
+STRUCTURED_FIELDS = {
+    "title": ("headline", "name"),
+    "subtitle": ("description", "alternativeHeadline"),
+    "date": ("datePublished", "dateCreated"),
+    "content": ("articleBody",),
+}
+
+
+def compile_css(css):
+    # ::text and ::attr() are understood, as in response.css
+    return etree.XPath(translator.css_to_xpath(css), smart_strings=False)
+
+
+def compile_container(css):
+    # The ancestors-or-self of a match that match the first compound
+    # selector of css, outermost first: div.entry-content for
+    # "div.entry-content > section > p". None when a selector of css has no
+    # combinator, as then nothing bounds where its matches may appear.
+    paths = []
+    for selector in parse_css(css):
+        tree = selector.parsed_tree
+        if not isinstance(tree, CombinedSelector):
+            return None
+        while isinstance(tree, CombinedSelector):
+            tree = tree.selector
+        paths.append("ancestor-or-self::" + str(translator.xpath(tree)))
+    return etree.XPath(" | ".join(paths), smart_strings=False)
+
+
+def parse_html(text):
+    # The same tree parsel builds for response.css
+    body = text.strip().replace("\x00", "").encode("utf-8") or b"<html/>"
+    parser = html.HTMLParser(recover=True, encoding="utf-8", huge_tree=True)
+    root = etree.fromstring(body, parser=parser)
+    if root is None:
+        root = etree.fromstring(b"<html/>", parser=parser)
+    return root
+
+
+def open_elements(root):
+    # The elements the parser may still be adding to: the root and its last
+    # child, down to the last element fed. Every other element has ended.
+    elements = set()
+    elem = root
+    while elem is not None:
+        elements.add(elem)
+        elem = elem[-1] if len(elem) else None
+    return elements
+
+
+def parse_partial(text, fields, chunk_size=PARTIAL_CHUNK_SIZE):
+    # The tree of the page up to the point where every field of fields is
+    # complete, or of the whole page if one never is. Chunks double in size
+    # so a page where a field never completes costs a few checks, not one
+    # per chunk.
+    body = text.strip().replace("\x00", "").encode("utf-8") or b"<html/>"
+    parser = etree.HTMLPullParser(
+        events=("start",), tag="html", recover=True, encoding="utf-8", huge_tree=True
+    )
+    root = None
+    pending = list(fields)
+    offset = 0
+    while offset < len(body):
+        parser.feed(body[offset : offset + chunk_size])
+        offset += chunk_size
+        chunk_size *= 2
+        for _, elem in parser.read_events():
+            root = elem
+        if root is None:
+            continue
+        # A complete field stays complete, so only the others are checked
+        unfinished = open_elements(root)
+        pending = [f for f in pending if not f.complete(root, unfinished)]
+        if not pending:
+            break
+    root = parser.close()
+    if root is None:
+        root = etree.fromstring(b"<html/>", parser=html.HTMLParser())
+    return root
+
+
+def serialize(value):
+    # Text and attribute matches are strings already; elements are
+    # serialized like Selector.get()
+    if isinstance(value, str):
+        return value
+    if etree.iselement(value):
+        return etree.tostring(value, method="html", encoding="unicode", with_tail=False)
+    return str(value)
+
+
+def iter_jsonld(data):
+    # Every object of a JSON-LD document, including @graph and mainEntity
+    if isinstance(data, list):
+        for entry in data:
+            yield from iter_jsonld(entry)
+    elif isinstance(data, dict):
+        yield data
+        for key in ("@graph", "mainEntity"):
+            if key in data:
+                yield from iter_jsonld(data[key])
+
+
+def is_article(obj):
+    types = obj.get("@type")
+    if not isinstance(types, list):
+        types = [types]
+    return any(isinstance(t, str) and t in ARTICLE_TYPES for t in types)
+
+
+def structured_data(text):
+    # The first article object embedded as JSON-LD, or None
+    for match in JSONLD.finditer(text):
+        try:
+            data = json.loads(match.group(1), strict=False)
+        except ValueError:
+            continue
+        for obj in iter_jsonld(data):
+            if is_article(obj):
+                return obj
+    return None
+
+
+def structured_value(article, properties):
+    for prop in properties:
+        value = article.get(prop)
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if isinstance(value, str):
+            value = unescape(value).strip()
+            if value:
+                return value
+    return None
+
+
+class Field:
+    def __init__(self, spec):
+        if not isinstance(spec, dict):
+            spec = {"css": spec}
+        css = spec["css"]
+        self.css = [css] if isinstance(css, str) else list(css)
+        self.selectors = [compile_css(c) for c in self.css]
+        self.elements = [compile_css(PSEUDO_ELEMENT.sub("", c)) for c in self.css]
+        self.containers = [
+            compile_container(PSEUDO_ELEMENT.sub("", c)) for c in self.css
+        ]
+        self.join = spec.get("join", False)
+        self.default = spec.get("default")
+
+    def extract(self, root):
+        for selector in self.selectors:
+            values = selector(root)
+            if not values:
+                continue
+            if self.join:
+                value = " ".join(serialize(v) for v in values)
+            else:
+                value = serialize(values[0])
+            if value:
+                return value
+        return self.default
+
+    def complete(self, root, unfinished):
+        # Whether this field has its final value in a partial tree, given
+        # the elements still open in it. More matches of a joined field may
+        # follow the last one anywhere inside its container (sibling
+        # wrappers such as div.entry-content > section > p), so it waits for
+        # the outermost container to end; without one it is never complete
+        # and the whole page is parsed.
+        for selector, container in zip(self.elements, self.containers):
+            matches = selector(root)
+            if not matches:
+                continue
+            if not self.join:
+                return matches[0] not in unfinished
+            if container is None:
+                return False
+            boundaries = container(matches[-1])
+            return bool(boundaries) and boundaries[0] not in unfinished
+        return False
+
+
+class Extractor:
+    def __init__(self, name, spec):
+        self.name = name
+        self.source = spec["source"]
+        self.start_urls = spec["start_urls"]
+        self.links = spec["links"]
+        self.next_page = spec.get("next_page")
+        self.feeds = spec.get("feeds", [])
+        self.fields = {name: Field(field) for name, field in spec["fields"].items()}
+        self.required = spec.get("required", list(self.fields))
+        self.date_format = spec.get("date_format")
+        self.structured_data = spec.get("structured_data", True)
+
+    def extract(self, text, partial=False):
+        # Field values of an article page, from its decoded text, and the
+        # path that produced them: "structured_data", "css" or "mixed"
+        values = {}
+        if self.structured_data:
+            article = structured_data(text)
+            if article is not None:
+                for name in self.fields:
+                    if name in STRUCTURED_FIELDS:
+                        values[name] = structured_value(
+                            article, STRUCTURED_FIELDS[name]
+                        )
+
+        missing = [name for name in self.fields if not values.get(name)]
+        if missing:
+            if partial:
+                root = parse_partial(
+                    text,
+                    [self.fields[name] for name in self.required if name in missing],
+                )
+            else:
+                root = parse_html(text)
+            for name in missing:
+                values[name] = self.fields[name].extract(root)
+
+        if not missing:
+            return values, "structured_data"
+        if len(missing) == len(self.fields):
+            return values, "css"
+        return values, "mixed"
+
+    def parse_date(self, date_str):
+        if date_str and self.date_format:
+            try:
+                return datetime.strptime(date_str.strip(), self.date_format)
+            except ValueError:
+                pass
+        return parse_date(date_str)
+
+
+def load_extractors(path=SOURCES_FILE):
+    with open(path, encoding="utf-8") as f:
+        return {name: Extractor(name, spec) for name, spec in json.load(f).items()}
+
+
+EXTRACTORS = load_extractors()
+
+
+def extract_article(name, text, partial=False, clean=False):
+    # The field values of an article page of a source, with its date
+    # parsed, the extraction path and the date text as found
+    extractor = EXTRACTORS[name]
+    values, path = extractor.extract(text, partial=partial)
+    date_str = values.get("date")
+    values["date"] = extractor.parse_date(date_str)
+    if clean:
+        for field in CLEANED_FIELDS:
+            if values.get(field):
+                values[field] = normalize_text(clean_html(values[field]))
+    return values, path, date_str
+
+
+def process_article(name, url, body, content_type, partial=False):
+    # extract_article for a raw response, in a worker process. The body is
+    # decoded the way the response in the crawl decodes it.
+    headers = {"Content-Type": content_type} if content_type else None
+    text = scrapy.http.HtmlResponse(url, body=body, headers=headers).text
+    return extract_article(name, text, partial=partial, clean=True)
+
+
+class ArticleSpider(FeedDiscoveryMixin, scrapy.Spider):
+    # Spider for the sources.json entry named like the spider
+    custom_settings = {
+        "ROBOTSTXT_OBEY": True,
+    }
+    extractor = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        extractor = EXTRACTORS.get(getattr(cls, "name", None))
+        if extractor is None:
+            return
+        cls.extractor = extractor
+        if "start_urls" not in cls.__dict__:
+            cls.start_urls = extractor.start_urls
+        if extractor.feeds and "feed_urls" not in cls.__dict__:
+            cls.feed_urls = extractor.feeds
+        if extractor.next_page and "next_page_selector" not in cls.__dict__:
+            cls.next_page_selector = extractor.next_page
+
+    def parse(self, response):
+        # Extract all article URLs from the page
+        for url in response.css(self.extractor.links).getall():
+            # Ensure we have absolute URLs
+            absolute_url = urljoin(response.url, url)
+            yield response.follow(absolute_url, callback=self.parse_article)
+
+        # Continue with the next listing page, last so the known-url check
+        # has seen every entry of this one
+        next_page = next_page_request(self, response)
+        if next_page:
+            yield next_page
+
+    def parse_article(self, response):
+        partial = self.settings.getbool("PARTIAL_PARSING")
+        offload = parse_offload(self.crawler)
+        if offload is not None:
+            return self.parse_offloaded(offload, response, partial)
+        try:
+            result = extract_article(self.extractor.name, response.text, partial)
+        except Exception as e:
+            self.logger.error("Error parsing article %s: %s", response.url, e)
+            return []
+        return self.article_items(response, *result)
+
+    async def parse_offloaded(self, offload, response, partial):
+        try:
+            d = offload.submit(
+                process_article,
+                self.extractor.name,
+                response.url,
+                response.body,
+                response.headers.get("Content-Type"),
+                partial,
+            )
+            result = await maybe_deferred_to_future(d)
+        except Exception as e:
+            self.logger.error("Error parsing article %s: %s", response.url, e)
+            return []
+        return self.article_items(response, *result, cleaned=True)
+
+    def article_items(self, response, values, path, date_str, cleaned=False):
+        if date_str and not values["date"]:
+            self.logger.warning(
+                "Could not parse date: %s", date_str, extra={"reason": "date"}
+            )
+            self.crawler.stats.inc_value("dates/parse_failed")
+
+        missing = check_required(
+            self, **{name: values.get(name) for name in self.extractor.required}
+        )
+        if missing:
+            self.logger.warning(
+                "Skipping article %s: missing %s",
+                response.url,
+                ", ".join(missing),
+                extra={"reason": "missing_fields"},
+            )
+            return []
+
+        self.crawler.stats.inc_value(f"extraction/{path}")
+        item = NewsItem(
+            title=(values.get("title") or "").strip(),
+            subtitle=(values.get("subtitle") or "").strip(),
+            content=values.get("content"),
+            date=values["date"],
+            url=response.url,
+            source=self.extractor.source,
+            cleaned=cleaned,
+        )
+        return [item]
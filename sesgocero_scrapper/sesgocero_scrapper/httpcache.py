@@ -0,0 +1,200 @@
+# HTTP cache storage for development and offline replay
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#writing-your-own-storage-backend
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+class CompressedCacheStorage:
+    # Keeps every cached response in one SQLite file shared by all spiders.
+    # Bodies are zlib-compressed and stored once per content hash, so pages
+    # served under several urls (or unchanged between runs) take no extra
+    # space. When the compressed bodies exceed HTTPCACHE_MAX_BYTES, the least
+    # recently used entries are evicted. With HTTPCACHE_REPLAY nothing is
+    # stored, evicted or expired; combine it with HTTPCACHE_IGNORE_MISSING so
+    # requests missing from the cache never reach the network.
+    #
+    # Cache hits do not write: their access times are kept in memory and
+    # written with the next stored response, before evicting, every
+    # ACCESS_BATCH hits and at close, each time in a committed transaction so
+    # other spiders writing to the file are never left waiting on it.
+
+    ACCESS_BATCH = 1000
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings["HTTPCACHE_DIR"], createdir=True)
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.max_bytes = settings.getint("HTTPCACHE_MAX_BYTES", 512 * 1024 * 1024)
+        self.compression_level = settings.getint("HTTPCACHE_COMPRESSION_LEVEL", 6)
+        self.replay = settings.getbool("HTTPCACHE_REPLAY")
+        self.db = None
+        self.total_bytes = 0
+        self.accessed = {}
+
+    def open_spider(self, spider):
+        path = os.path.join(self.cachedir, "compressed.db")
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS bodies ("
+            "hash TEXT PRIMARY KEY, data BLOB, size INTEGER, refs INTEGER)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "fingerprint TEXT PRIMARY KEY, meta BLOB, body_hash TEXT, "
+            "stored REAL, accessed REAL)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self.db.commit()
+        self.total_bytes = self.stored_bytes()
+
+        logger.debug(
+            "Using compressed cache storage in %(cachepath)s",
+            {"cachepath": path},
+            extra={"spider": spider},
+        )
+
+        self._fingerprinter = spider.crawler.request_fingerprinter
+
+    def close_spider(self, spider):
+        self.write_accesses()
+        self.db.commit()
+        self.db.close()
+
+    def write_accesses(self):
+        # Runs inside the caller's transaction; the caller commits
+        if self.accessed:
+            self.db.executemany(
+                "UPDATE responses SET accessed = ? WHERE fingerprint = ?",
+                [(accessed, key) for key, accessed in self.accessed.items()],
+            )
+            self.accessed = {}
+
+    def stored_bytes(self):
+        row = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()
+        return row[0]
+
+    def retrieve_response(self, spider, request):
+        key = self._fingerprinter.fingerprint(request).hex()
+        row = self.db.execute(
+            "SELECT r.meta, r.stored, b.data FROM responses r "
+            "JOIN bodies b ON b.hash = r.body_hash WHERE r.fingerprint = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None  # not cached
+
+        meta, stored, data = row
+        if not self.replay and 0 < self.expiration_secs < time.time() - stored:
+            return None  # expired
+
+        if not self.replay:
+            self.accessed[key] = time.time()
+            if len(self.accessed) >= self.ACCESS_BATCH:
+                self.write_accesses()
+                self.db.commit()
+
+        meta = pickle.loads(meta)
+        url = meta["url"]
+        status = meta["status"]
+        headers = Headers(meta["headers"])
+        body = zlib.decompress(data)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        if self.replay:
+            return
+
+        key = self._fingerprinter.fingerprint(request).hex()
+        body_hash = hashlib.blake2b(response.body, digest_size=16).hexdigest()
+        meta = {
+            "status": response.status,
+            "url": response.url,
+            "headers": dict(response.headers),
+        }
+        now = time.time()
+
+        previous = self.db.execute(
+            "SELECT body_hash FROM responses WHERE fingerprint = ?", (key,)
+        ).fetchone()
+        # Same body as before: only the metadata is refreshed
+        if previous is None or previous[0] != body_hash:
+            if previous is not None:
+                self.release_body(previous[0])
+            self.retain_body(body_hash, response.body)
+
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+            (key, pickle.dumps(meta, protocol=4), body_hash, now, now),
+        )
+        self.accessed.pop(key, None)
+        self.write_accesses()
+        self.db.commit()
+
+        if self.total_bytes > self.max_bytes:
+            self.evict(spider)
+
+    def retain_body(self, body_hash, body):
+        cursor = self.db.execute(
+            "UPDATE bodies SET refs = refs + 1 WHERE hash = ?", (body_hash,)
+        )
+        if cursor.rowcount == 0:
+            data = zlib.compress(body, self.compression_level)
+            self.db.execute(
+                "INSERT INTO bodies VALUES (?, ?, ?, 1)", (body_hash, data, len(data))
+            )
+            self.total_bytes += len(data)
+
+    def release_body(self, body_hash):
+        self.db.execute(
+            "UPDATE bodies SET refs = refs - 1 WHERE hash = ?", (body_hash,)
+        )
+        row = self.db.execute(
+            "SELECT size FROM bodies WHERE hash = ? AND refs <= 0", (body_hash,)
+        ).fetchone()
+        if row is not None:
+            self.db.execute("DELETE FROM bodies WHERE hash = ?", (body_hash,))
+            self.total_bytes -= row[0]
+
+    def evict(self, spider):
+        # Other spiders share the file, so recount before evicting
+        self.write_accesses()
+        self.db.commit()
+        self.total_bytes = self.stored_bytes()
+        evicted = 0
+        while self.total_bytes > self.max_bytes:
+            rows = self.db.execute(
+                "SELECT fingerprint, body_hash FROM responses "
+                "ORDER BY accessed LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for fingerprint, body_hash in rows:
+                self.db.execute(
+                    "DELETE FROM responses WHERE fingerprint = ?", (fingerprint,)
+                )
+                self.release_body(body_hash)
+                evicted += 1
+                if self.total_bytes <= self.max_bytes:
+                    break
+        self.db.commit()
+        logger.debug(
+            "Evicted %(count)d cached responses",
+            {"count": evicted},
+            extra={"spider": spider},
+        )
@@ -9,3 +9,5 @@ class NewsItem(scrapy.Item):
     url = scrapy.Field(unique=True)
     source = scrapy.Field()
     cleaned = scrapy.Field()
+    content_hash = scrapy.Field()
+    duplicate_cluster = scrapy.Field()
@@ -0,0 +1,136 @@
+# Logging profiles
+#
+# LOG_PROFILE = "production" (or `-s LOG_PROFILE=production`) switches the
+# log handlers to one JSON object per line and drops repeated warnings past
+# LOG_RATE_LIMIT per spider and reason every LOG_RATE_WINDOW seconds; the
+# next one let through carries the number suppressed. In every profile the
+# MongoDB driver logs through its own logger, capped at LOG_DRIVER_LEVEL
+# and written to LOG_DRIVER_FILE when set, so topology chatter does not
+# flood the crawl log.
+
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import threading
+import time
+
+from scrapy import signals
+from scrapy.utils.log import get_scrapy_root_handler
+
+DRIVER_LOGGERS = ("pymongo",)
+
+# Record attributes copied into the JSON object when present
+EXTRA_FIELDS = ("reason", "url", "suppressed")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        spider = getattr(record, "spider", None)
+        if spider is not None:
+            entry["spider"] = getattr(spider, "name", str(spider))
+        for field in EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    # Lets through at most `limit` warnings per logger (one per spider) and
+    # reason every `window` seconds. The reason is the `reason` extra or,
+    # failing that, the unformatted message, which is why messages are
+    # passed as a template plus arguments rather than pre-formatted
+    # strings. Errors are never dropped.
+
+    def __init__(self, limit=10, window=60.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.seen = {}
+        # Pipeline writer threads log too
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno != logging.WARNING:
+            return True
+        key = (record.name, getattr(record, "reason", None) or str(record.msg))
+        now = time.monotonic()
+        with self.lock:
+            state = self.seen.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                if suppressed:
+                    record.suppressed = suppressed
+                self.seen[key] = [now, 1, 0]
+                return True
+            if state[1] < self.limit:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+def cap_driver_loggers(level, path=None):
+    for name in DRIVER_LOGGERS:
+        driver = logging.getLogger(name)
+        driver.setLevel(level)
+        if path and not any(
+            isinstance(h, logging.FileHandler)
+            and h.baseFilename == os.path.abspath(path)
+            for h in driver.handlers
+        ):
+            handler = logging.FileHandler(path, encoding="utf-8")
+            handler.setFormatter(
+                logging.Formatter("%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+            )
+            driver.addHandler(handler)
+            driver.propagate = False
+
+
+def apply_production_profile(limit, window):
+    # On the handler Scrapy installed on the root logger; every crawler of a
+    # process calls this, so it only changes it once
+    handler = get_scrapy_root_handler()
+    if handler is None:
+        return
+    if not isinstance(handler.formatter, JsonFormatter):
+        handler.setFormatter(JsonFormatter())
+    if not any(isinstance(f, RateLimitFilter) for f in handler.filters):
+        handler.addFilter(RateLimitFilter(limit, window))
+
+
+class LoggingProfile:
+    # Extension: applies the logging settings. Each crawler replaces the
+    # Scrapy root handler after building its extensions, so the profile is
+    # applied when the spider opens.
+
+    def __init__(self, limit=10, window=60.0):
+        self.limit = limit
+        self.window = window
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        cap_driver_loggers(
+            settings.get("LOG_DRIVER_LEVEL", "WARNING"),
+            settings.get("LOG_DRIVER_FILE"),
+        )
+        ext = cls(
+            limit=settings.getint("LOG_RATE_LIMIT", 10),
+            window=settings.getfloat("LOG_RATE_WINDOW", 60.0),
+        )
+        if settings.get("LOG_PROFILE", "default") == "production":
+            crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        return ext
+
+    def spider_opened(self, spider):
+        apply_production_profile(self.limit, self.window)
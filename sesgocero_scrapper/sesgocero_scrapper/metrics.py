@@ -0,0 +1,341 @@
+# Per-stage latency histograms and counters, exported in the Prometheus text
+# format
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/extensions.html
+# https://prometheus.io/docs/instrumenting/exposition_formats/
+
+from bisect import bisect_left
+import json
+import logging
+import os
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.project import data_path
+from twisted.internet import task
+from twisted.python import threadable
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+# Stats exported as counters: skipped articles by missing field, date
+# parse failures, the extraction path of each item and the pipeline outcomes
+COUNTER_PREFIXES = (
+    "articles/",
+    "dates/",
+    "extraction/",
+    "mongodb/items/",
+    "near_duplicates/",
+    "known_urls/",
+    "revalidation/",
+)
+
+
+def check_required(spider, **fields):
+    # Names of the required fields that came out empty, each counted in the
+    # articles/skipped/missing_<field> stat
+    missing = [name for name, value in fields.items() if not value]
+    for name in missing:
+        spider.crawler.stats.inc_value(f"articles/skipped/missing_{name}")
+    if missing:
+        spider.crawler.stats.inc_value("articles/skipped")
+    return missing
+
+
+def stage_metrics(crawler):
+    # The StageMetrics extension of this crawler, or None if it is disabled
+    for extension in crawler.extensions.middlewares:
+        if isinstance(extension, StageMetrics):
+            return extension
+    return None
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket, as histogram_quantile does,
+        # kept within the observed range
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = max(BUCKETS[i - 1] if i else 0.0, self.min)
+                upper = min(BUCKETS[i] if i < len(BUCKETS) else self.max, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+
+def label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+class StageMetrics:
+    # Latency histograms per stage (download, every spider callback,
+    # clean_html, near-duplicate lookup, MongoDB writes) plus the counters in
+    # COUNTER_PREFIXES. Recording costs a bisect and a few additions; the
+    # text is only rendered every METRICS_INTERVAL seconds, at close and when
+    # the endpoint is scraped. Files go to METRICS_DIR: <spider>.prom for the
+    # node_exporter textfile collector and <spider>.json at close. With
+    # METRICS_PORT, http://127.0.0.1:<port>/metrics serves every spider of
+    # the process.
+
+    def __init__(self, crawler, directory=None, interval=15.0, port=0):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.directory = directory
+        self.interval = interval
+        self.port = port
+        self.histograms = {}
+        self.spider = None
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("METRICS_ENABLED"):
+            raise NotConfigured
+        directory = settings.get("METRICS_DIR")
+        ext = cls(
+            crawler,
+            directory=data_path(directory, createdir=True) if directory else None,
+            interval=settings.getfloat("METRICS_INTERVAL", 15.0),
+            port=settings.getint("METRICS_PORT", 0),
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        return ext
+
+    def observe(self, stage, seconds):
+        if not threadable.isInIOThread():
+            # Writer threads: record from the reactor like the stats
+            from twisted.internet import reactor
+
+            reactor.callFromThread(self.observe, stage, seconds)
+            return
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        if self.port:
+            MetricsServer.register(self, self.port)
+        if self.directory and self.interval > 0:
+            self.loop = task.LoopingCall(self.write_prometheus)
+            self.loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+        if self.port:
+            MetricsServer.unregister(self)
+        if self.directory:
+            self.write_prometheus()
+            self.write_summary(reason)
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get("download_latency")
+        if latency is not None and "cached" not in response.flags:
+            self.observe("download", latency)
+
+    def counters(self):
+        return {
+            key: value
+            for key, value in self.stats.get_stats().items()
+            if key.startswith(COUNTER_PREFIXES)
+            and isinstance(value, (int, float))
+            and not isinstance(value, bool)
+        }
+
+    def render(self):
+        spider = label(self.spider.name if self.spider else "")
+        lines = []
+        for stage, histogram in sorted(self.histograms.items()):
+            labels = f'spider="{spider}",stage="{label(stage)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(
+                    f'sesgocero_stage_seconds_bucket{{{labels},le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(
+                f'sesgocero_stage_seconds_bucket{{{labels},le="+Inf"}} '
+                f"{histogram.count}"
+            )
+            lines.append(f"sesgocero_stage_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"sesgocero_stage_seconds_count{{{labels}}} {histogram.count}")
+        stage_lines = lines
+
+        lines = []
+        for key, value in sorted(self.counters().items()):
+            lines.append(
+                f'sesgocero_events_total{{spider="{spider}",event="{label(key)}"}} '
+                f"{value}"
+            )
+        return stage_lines, lines
+
+    @staticmethod
+    def exposition(rendered):
+        stage_lines = []
+        counter_lines = []
+        for stages, counters in rendered:
+            stage_lines += stages
+            counter_lines += counters
+        lines = [
+            "# HELP sesgocero_stage_seconds Latency of each crawl stage.",
+            "# TYPE sesgocero_stage_seconds histogram",
+            *stage_lines,
+            "# HELP sesgocero_events_total Skipped articles, date parse "
+            "failures and pipeline outcomes.",
+            "# TYPE sesgocero_events_total counter",
+            *counter_lines,
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        path = os.path.join(self.directory, f"{self.spider.name}.prom")
+        # Written aside and renamed so the collector never reads half a file
+        with open(path + ".tmp", "w") as f:
+            f.write(self.exposition([self.render()]))
+        os.replace(path + ".tmp", path)
+
+    def write_summary(self, reason):
+        stages = {}
+        for stage, histogram in sorted(self.histograms.items()):
+            stages[stage] = {
+                "count": histogram.count,
+                "total_s": round(histogram.sum, 3),
+                "mean_ms": round(histogram.sum / histogram.count * 1000, 2),
+                "max_ms": round(histogram.max * 1000, 2),
+                **{
+                    f"p{int(q * 100)}_ms": round(histogram.quantile(q) * 1000, 2)
+                    for q in (0.5, 0.95, 0.99)
+                },
+            }
+        summary = {
+            "spider": self.spider.name,
+            "finish_reason": reason,
+            "finished": time.time(),
+            "stages": stages,
+            "counters": self.counters(),
+        }
+        path = os.path.join(self.directory, f"{self.spider.name}.json")
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+
+
+class MetricsServer:
+    # One /metrics endpoint per process, shared by every crawler in it
+
+    extensions = []
+    port = None
+
+    @classmethod
+    def register(cls, extension, port):
+        if cls.port is None:
+            from twisted.internet import reactor
+            from twisted.internet.error import CannotListenError
+            from twisted.web.resource import Resource
+            from twisted.web.server import Site
+
+            class Metrics(Resource):
+                isLeaf = True
+
+                def render_GET(self, request):
+                    request.setHeader(
+                        b"Content-Type", b"text/plain; version=0.0.4; charset=utf-8"
+                    )
+                    rendered = [ext.render() for ext in cls.extensions]
+                    return StageMetrics.exposition(rendered).encode("utf-8")
+
+            root = Resource()
+            root.putChild(b"metrics", Metrics())
+            try:
+                cls.port = reactor.listenTCP(port, Site(root), interface="127.0.0.1")
+            except CannotListenError as e:
+                # Another process of a sharded run already serves the port
+                logger.warning("Metrics endpoint not started: %s", e)
+                cls.port = False
+        cls.extensions.append(extension)
+
+    @classmethod
+    def unregister(cls, extension):
+        if extension in cls.extensions:
+            cls.extensions.remove(extension)
+        if not cls.extensions and cls.port:
+            cls.port.stopListening()
+            cls.port = None
+
+
+class StageTimingMiddleware:
+    # Spider middleware closest to the spider: times every spider callback,
+    # counting only the time spent inside the callback's generator
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        metrics = stage_metrics(crawler)
+        if metrics is None:
+            raise NotConfigured
+        return cls(metrics)
+
+    def process_spider_output(self, response, result, spider):
+        callback = response.request.callback or spider.parse
+        stage = getattr(callback, "__name__", "callback")
+        elapsed = 0.0
+        iterator = iter(result)
+        while True:
+            started = time.perf_counter()
+            try:
+                i = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - started
+            yield i
+        self.metrics.observe(stage, elapsed)
@@ -3,11 +3,26 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+import hashlib
+import os
+import sqlite3
+import time
+
+from scrapy import Request, signals
+from scrapy.downloadermiddlewares.robotstxt import RobotsTxtMiddleware
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.project import data_path
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from .storage import MongoStorage, article_stored
+
 
 class SesgoceroScrapperSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -101,3 +116,516 @@ class SesgoceroScrapperDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+def is_article_request(request, spider):
+    parse_article = getattr(spider, "parse_article", None)
+    return parse_article is not None and request.callback == parse_article
+
+
+def is_listing_request(request, spider):
+    # Start urls have no callback and go to parse as well
+    return request.callback is None or request.callback == spider.parse
+
+
+class KnownUrls:
+    # Fingerprints of the article urls stored in MongoDB: a sorted array of
+    # 64-bit hashes (8 bytes per url) loaded from the collection, plus a set
+    # with the urls stored since the load. Articles newer than refetch_days
+    # are left out, and so are not added as they are stored.
+
+    def __init__(self, refetch_days=0):
+        self.refetch_days = refetch_days
+        self.hashes = array("Q")
+        self.added = set()
+        # time.monotonic() of the last load, None before the first
+        self.loaded = None
+
+    @staticmethod
+    def fingerprint(url):
+        return int.from_bytes(
+            hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+
+    def load(self):
+        storage = MongoStorage.acquire()
+        try:
+            collection = storage.collection
+            query = {}
+            if self.refetch_days > 0:
+                cutoff = datetime.now() - timedelta(days=self.refetch_days)
+                query = {
+                    "$or": [
+                        {"date": {"$lt": cutoff.isoformat()}},
+                        {"date": {"$exists": False}},
+                    ]
+                }
+            cursor = collection.find(query, {"url": 1, "_id": 0}, batch_size=10000)
+            hashes = sorted(
+                self.fingerprint(doc["url"]) for doc in cursor if doc.get("url")
+            )
+        finally:
+            storage.release()
+        self.hashes = array("Q", hashes)
+        self.added.clear()
+        self.loaded = time.monotonic()
+
+    def add(self, urls):
+        if self.refetch_days > 0:
+            return
+        self.added.update(self.fingerprint(url) for url in urls)
+
+    def __contains__(self, url):
+        h = self.fingerprint(url)
+        if h in self.added:
+            return True
+        i = bisect_left(self.hashes, h)
+        return i < len(self.hashes) and self.hashes[i] == h
+
+    def __len__(self):
+        return len(self.hashes) + len(self.added)
+
+
+class KnownUrlsMiddleware:
+    # Drops requests for articles that are already stored in MongoDB before
+    # they are downloaded (see KnownUrls). Articles newer than
+    # KNOWN_URLS_REFETCH_DAYS are left out of the set so they are fetched
+    # again and revisions are still picked up.
+    #
+    # It also bounds pagination: the number of consecutive known entries is
+    # carried from each listing page to the next, and once it reaches
+    # KNOWN_URLS_STOP_AFTER the next page is not requested, so catching up
+    # reads only as many pages as there are new articles.
+    #
+    # The set is loaded from the collection when the spider opens, unless
+    # the spider was given a known_urls dict (the daemon passes the same one
+    # to every crawl): then the set in it for KNOWN_URLS_REFETCH_DAYS is
+    # reused, and only loaded again after KNOWN_URLS_CACHE_TTL seconds.
+    # Articles MongoDBPipeline stores are added to the set as they are.
+
+    def __init__(self, stats, refetch_days=0, stop_after=0, ttl=86400):
+        self.stats = stats
+        self.refetch_days = refetch_days
+        self.stop_after = stop_after
+        self.ttl = ttl
+        self.known = KnownUrls(refetch_days)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("KNOWN_URLS_ENABLED"):
+            raise NotConfigured
+        s = cls(
+            crawler.stats,
+            refetch_days=crawler.settings.getfloat("KNOWN_URLS_REFETCH_DAYS", 0),
+            stop_after=crawler.settings.getint("KNOWN_URLS_STOP_AFTER", 0),
+            ttl=crawler.settings.getfloat("KNOWN_URLS_CACHE_TTL", 86400),
+        )
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.article_stored, signal=article_stored)
+        return s
+
+    def is_known(self, url):
+        return url in self.known
+
+    def process_spider_output(self, response, result, spider):
+        listing = is_listing_request(response.request, spider)
+        run = response.meta.get("known_run", 0)
+        for i in result:
+            if isinstance(i, Request) and is_article_request(i, spider):
+                if self.is_known(i.url):
+                    self.stats.inc_value("known_urls/skipped", spider=spider)
+                    run += 1
+                    continue
+                run = 0
+            elif listing and isinstance(i, Request) and is_listing_request(i, spider):
+                if self.stop_after and run >= self.stop_after:
+                    self.stats.inc_value("known_urls/pagination_stopped", spider=spider)
+                    spider.logger.info(
+                        "Stopping pagination at %s: %d known articles in a row",
+                        response.url,
+                        run,
+                    )
+                    continue
+                i.meta["known_run"] = run
+            yield i
+
+    def spider_opened(self, spider):
+        shared = getattr(spider, "known_urls", None)
+        if shared is not None:
+            self.known = shared.setdefault(
+                self.refetch_days, KnownUrls(self.refetch_days)
+            )
+        known = self.known
+        if known.loaded is not None and time.monotonic() - known.loaded < self.ttl:
+            self.stats.set_value("known_urls/shared", len(known), spider=spider)
+            return
+
+        known.load()
+        self.stats.set_value("known_urls/loaded", len(known), spider=spider)
+        spider.logger.info(
+            "Loaded %d known article urls (%d KiB)",
+            len(known),
+            known.hashes.itemsize * len(known.hashes) // 1024,
+        )
+
+    def article_stored(self, urls, spider):
+        self.known.add(urls)
+
+
+class SharedRobotsTxtMiddleware(RobotsTxtMiddleware):
+    # RobotsTxtMiddleware whose parsed robots.txt files outlive the crawl:
+    # later crawls in the same process (run_all_spiders.py --daemon) reuse
+    # them for ROBOTSTXT_CACHE_TTL seconds instead of fetching them again.
+    # Failed fetches are not shared.
+    parsers = {}
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.ttl = crawler.settings.getfloat("ROBOTSTXT_CACHE_TTL", 86400)
+
+    def robot_parser(self, request, spider):
+        netloc = urlparse_cached(request).netloc
+        if netloc not in self._parsers and netloc in self.parsers:
+            parser, fetched = self.parsers[netloc]
+            if time.monotonic() - fetched < self.ttl:
+                self._parsers[netloc] = parser
+                self.crawler.stats.inc_value("robotstxt/shared")
+        return super().robot_parser(request, spider)
+
+    def _parse_robots(self, response, netloc, spider):
+        super()._parse_robots(response, netloc, spider)
+        self.parsers[netloc] = (self._parsers[netloc], time.monotonic())
+
+
+class RevalidationMiddleware:
+    # Revalidates article pages with conditional GETs. The ETag,
+    # Last-Modified and a hash of the body of every article response are
+    # kept in a local SQLite database; later runs send If-None-Match and
+    # If-Modified-Since. A 304, or a 200 whose body hash did not change, is
+    # dropped here so neither parse_article nor the pipelines run again.
+    #
+    # The validators of a response are only saved once MongoDBPipeline has
+    # stored its article (the article_stored signal). A page that was not
+    # extracted, was dropped by a pipeline or failed to be written keeps no
+    # validators, so the next run downloads and processes it again.
+
+    def __init__(self, stats, path):
+        self.stats = stats
+        self.path = path
+        self.db = None
+        # url -> (etag, last_modified, body_hash) of responses whose article
+        # has not been stored yet
+        self.pending = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("REVALIDATION_ENABLED"):
+            raise NotConfigured
+        path = data_path(crawler.settings.get("REVALIDATION_DB", "revalidation.db"))
+        s = cls(crawler.stats, path)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(s.article_stored, signal=article_stored)
+        return s
+
+    def spider_opened(self, spider):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=30)
+        # WAL lets the spiders of one run_all share the file
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL does not fsync on every commit
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS validators ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+            "body_hash TEXT, updated REAL)"
+        )
+        self.db.commit()
+
+    def spider_closed(self, spider):
+        # Whatever is still pending was never stored
+        self.pending.clear()
+        self.db.commit()
+        self.db.close()
+
+        hits = self.stats.get_value("revalidation/hit", 0, spider=spider)
+        hits += self.stats.get_value("revalidation/unchanged_body", 0, spider=spider)
+        misses = self.stats.get_value("revalidation/miss", 0, spider=spider)
+        if hits + misses:
+            self.stats.set_value(
+                "revalidation/hit_ratio",
+                round(hits / (hits + misses), 3),
+                spider=spider,
+            )
+
+    def lookup(self, url):
+        return self.db.execute(
+            "SELECT etag, last_modified, body_hash FROM validators WHERE url = ?",
+            (url,),
+        ).fetchone()
+
+    def store(self, rows):
+        # rows of (url, etag, last_modified, body_hash)
+        now = time.time()
+        self.db.executemany(
+            "INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?, ?)",
+            [row + (now,) for row in rows],
+        )
+        # Commit right away: the spiders of one process share the reactor
+        # thread, and a transaction left open here would block their writes
+        self.db.commit()
+
+    def article_stored(self, urls, spider):
+        rows = []
+        for url in urls:
+            validators = self.pending.pop(url, None)
+            if validators is not None:
+                rows.append((url,) + validators)
+        if rows:
+            self.store(rows)
+
+    def process_request(self, request, spider):
+        if not is_article_request(request, spider):
+            return None
+
+        stored = self.lookup(request.url)
+        if stored is None:
+            return None
+
+        etag, last_modified, body_hash = stored
+        if etag:
+            request.headers.setdefault("If-None-Match", etag)
+        if last_modified:
+            request.headers.setdefault("If-Modified-Since", last_modified)
+        request.meta["revalidation_hash"] = body_hash
+        if etag or last_modified:
+            self.stats.inc_value("revalidation/conditional", spider=spider)
+        return None
+
+    def process_response(self, request, response, spider):
+        if not is_article_request(request, spider):
+            return response
+
+        if response.status == 304:
+            self.stats.inc_value("revalidation/hit", spider=spider)
+            raise IgnoreRequest(f"Not modified: {request.url}")
+
+        if response.status != 200:
+            return response
+
+        body_hash = hashlib.blake2b(response.body, digest_size=16).hexdigest()
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        validators = (
+            etag.decode("latin-1") if etag else None,
+            last_modified.decode("latin-1") if last_modified else None,
+            body_hash,
+        )
+
+        if request.meta.get("revalidation_hash") == body_hash:
+            # The server ignored the validators but the page is the same, and
+            # its article is stored already
+            self.store([(request.url,) + validators])
+            self.stats.inc_value("revalidation/unchanged_body", spider=spider)
+            raise IgnoreRequest(f"Unchanged body: {request.url}")
+
+        self.pending[request.url] = validators
+        self.stats.inc_value("revalidation/miss", spider=spider)
+        return response
+
+
+class SlotState:
+    # What AdaptiveThrottleMiddleware knows about one download slot (domain)
+
+    def __init__(self, concurrency, delay):
+        self.concurrency = float(concurrency)
+        self.delay = delay
+        self.latency = None
+        self.baseline = None
+        self.samples = 0
+        self.error_rate = 0.0
+        self.hold_until = 0.0
+
+
+class AdaptiveThrottleMiddleware:
+    # Adjusts the concurrency and delay of every download slot (one per
+    # domain) from the responses it sees. While a site answers quickly and
+    # without errors the delay decays to ADAPTIVE_THROTTLE_MIN_DELAY and the
+    # concurrency grows by about one request per round trip, up to
+    # ADAPTIVE_THROTTLE_MAX_CONCURRENCY. A 429 or 503 or a download error
+    # halves the concurrency, or doubles the delay once the concurrency is
+    # down to one, and a Retry-After header is honored as the minimum delay.
+    # Rising latency takes one request off the concurrency. After a back-off
+    # the slot is held for one round trip (or one delay) so responses to
+    # requests already in flight do not back it off again.
+
+    ALPHA = 0.2
+    MIN_SAMPLES = 10
+    # Latency below this never counts as rising, however fast the site was
+    LATENCY_FLOOR = 0.25
+
+    def __init__(
+        self,
+        crawler,
+        start_concurrency=2,
+        max_concurrency=16,
+        min_delay=0.0,
+        max_delay=60.0,
+        target_latency=2.0,
+        latency_factor=3.0,
+        max_error_rate=0.1,
+    ):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.start_concurrency = start_concurrency
+        self.max_concurrency = max_concurrency
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.target_latency = target_latency
+        self.latency_factor = latency_factor
+        self.max_error_rate = max_error_rate
+        self.states = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
+        s = cls(
+            crawler,
+            start_concurrency=settings.getint("ADAPTIVE_THROTTLE_START_CONCURRENCY", 2),
+            max_concurrency=settings.getint("ADAPTIVE_THROTTLE_MAX_CONCURRENCY", 16),
+            min_delay=settings.getfloat("ADAPTIVE_THROTTLE_MIN_DELAY", 0.0),
+            max_delay=settings.getfloat("ADAPTIVE_THROTTLE_MAX_DELAY", 60.0),
+            target_latency=settings.getfloat("ADAPTIVE_THROTTLE_TARGET_LATENCY", 2.0),
+            latency_factor=settings.getfloat("ADAPTIVE_THROTTLE_LATENCY_FACTOR", 3.0),
+            max_error_rate=settings.getfloat("ADAPTIVE_THROTTLE_MAX_ERROR_RATE", 0.1),
+        )
+        crawler.signals.connect(
+            s.request_reached_downloader, signal=signals.request_reached_downloader
+        )
+        return s
+
+    def slot(self, request):
+        key = request.meta.get("download_slot")
+        downloader = self.crawler.engine.downloader
+        return key, downloader.slots.get(key)
+
+    def request_reached_downloader(self, request, spider):
+        # The slot of a new domain exists from here on; start it slow
+        key, slot = self.slot(request)
+        if slot is None or key in self.states:
+            return
+        state = self.states[key] = SlotState(self.start_concurrency, slot.delay)
+        self.apply(key, slot, state, spider)
+
+    def process_response(self, request, response, spider):
+        if "cached" in response.flags:
+            return response
+        key, slot = self.slot(request)
+        state = self.states.get(key)
+        if state is None:
+            return response
+
+        failed = response.status in (429, 503)
+        state.error_rate += self.ALPHA * (failed - state.error_rate)
+        latency = request.meta.get("download_latency")
+        if not failed and latency is not None:
+            self.observe_latency(state, latency)
+
+        if failed:
+            self.back_off(key, slot, state, spider, "status", errors=True)
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                self.stats.inc_value("throttle/retry_after", spider=spider)
+                state.delay = min(self.max_delay, max(state.delay, retry_after))
+                state.hold_until = max(state.hold_until, time.time() + retry_after)
+                self.apply(key, slot, state, spider)
+        elif self.latency_rising(state):
+            self.back_off(key, slot, state, spider, "latency", errors=False)
+        elif time.time() >= state.hold_until:
+            self.speed_up(key, slot, state, spider)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        key, slot = self.slot(request)
+        state = self.states.get(key)
+        if state is not None and slot is not None:
+            state.error_rate += self.ALPHA * (1 - state.error_rate)
+            self.back_off(key, slot, state, spider, "exception", errors=True)
+        return None
+
+    def observe_latency(self, state, latency):
+        if state.latency is None:
+            state.latency = latency
+        else:
+            state.latency += self.ALPHA * (latency - state.latency)
+        state.samples += 1
+        if state.samples >= self.MIN_SAMPLES and (
+            state.baseline is None or state.latency < state.baseline
+        ):
+            state.baseline = state.latency
+
+    def latency_rising(self, state):
+        if state.latency is None or state.latency < self.LATENCY_FLOOR:
+            return False
+        if state.latency > self.target_latency:
+            return True
+        return (
+            state.baseline is not None
+            and state.latency > state.baseline * self.latency_factor
+        )
+
+    def back_off(self, key, slot, state, spider, reason, errors):
+        now = time.time()
+        if now < state.hold_until:
+            return
+        if errors and state.concurrency < 2:
+            state.delay = min(self.max_delay, max(state.delay * 2, 0.25))
+        elif errors:
+            state.concurrency = max(1.0, state.concurrency / 2)
+        else:
+            state.concurrency = max(1.0, state.concurrency - 1)
+        state.hold_until = now + max(state.latency or 1.0, state.delay)
+        self.stats.inc_value(f"throttle/backoff/{reason}", spider=spider)
+        self.apply(key, slot, state, spider)
+
+    def speed_up(self, key, slot, state, spider):
+        # The delay recovers on every healthy response, the concurrency only
+        # while errors are rare: about one more request per round trip
+        state.delay = max(self.min_delay, state.delay / 2)
+        if state.delay < 0.01:
+            state.delay = self.min_delay
+        if state.error_rate <= self.max_error_rate:
+            state.concurrency = min(
+                float(self.max_concurrency), state.concurrency + 1 / state.concurrency
+            )
+        self.apply(key, slot, state, spider)
+
+    def apply(self, key, slot, state, spider):
+        slot.concurrency = int(state.concurrency)
+        slot.delay = state.delay
+        prefix = f"throttle/slots/{key}"
+        self.stats.set_value(f"{prefix}/concurrency", slot.concurrency, spider=spider)
+        self.stats.set_value(f"{prefix}/delay", round(slot.delay, 3), spider=spider)
+        self.stats.set_value(
+            f"{prefix}/error_rate", round(state.error_rate, 3), spider=spider
+        )
+        if state.latency is not None:
+            self.stats.set_value(
+                f"{prefix}/latency_ms", round(state.latency * 1000, 1), spider=spider
+            )
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    value = value.decode("latin-1").strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
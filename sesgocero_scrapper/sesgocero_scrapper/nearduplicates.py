@@ -0,0 +1,166 @@
+from array import array
+import hashlib
+import os
+import re
+import sqlite3
+
+WORD = re.compile(r"\w+")
+
+# Palabras por shingle
+SHINGLE_SIZE = 5
+
+# Firmas de 64 valores en 16 bandas de 4. Dos textos con similitud de
+# Jaccard 0.7 coinciden en alguna banda casi siempre; con 0.3, rara vez
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+
+# Los 6 bits altos de cada hash eligen la casilla, el resto es el valor
+BIN_BITS = 6
+VALUE_BITS = 64 - BIN_BITS
+VALUE_MASK = (1 << VALUE_BITS) - 1
+EMPTY = 1 << 64
+
+
+def stable_hash(data):
+    # hash() de Python cambia entre procesos; el índice es persistente
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def shingles(text):
+    words = WORD.findall(text.lower())
+    return {
+        stable_hash(" ".join(words[i : i + SHINGLE_SIZE]).encode("utf-8"))
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def signature(hashes):
+    # MinHash de una sola permutación: cada shingle cae en una casilla y
+    # cada casilla guarda su mínimo, una pasada en vez de NUM_HASHES. Las
+    # casillas vacías toman el valor de la siguiente ocupada más la
+    # distancia (densificación), así textos cortos siguen siendo comparables
+    bins = [EMPTY] * NUM_HASHES
+    for h in hashes:
+        i = h >> VALUE_BITS
+        value = h & VALUE_MASK
+        if value < bins[i]:
+            bins[i] = value
+
+    filled = [i for i, value in enumerate(bins) if value != EMPTY]
+    if not filled:
+        return None
+    if len(filled) < NUM_HASHES:
+        original = list(bins)
+        for i in range(NUM_HASHES):
+            if original[i] != EMPTY:
+                continue
+            for distance in range(1, NUM_HASHES):
+                value = original[(i + distance) % NUM_HASHES]
+                if value != EMPTY:
+                    bins[i] = value + (distance << VALUE_BITS)
+                    break
+    return array("Q", bins)
+
+
+def similarity(a, b):
+    # Fracción de casillas iguales: estimación de la similitud de Jaccard
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+
+def band_keys(sig):
+    keys = []
+    for band in range(BANDS):
+        data = bytes([band]) + sig[band * ROWS : (band + 1) * ROWS].tobytes()
+        digest = hashlib.blake2b(data, digest_size=8).digest()
+        # SQLite guarda enteros de 64 bits con signo
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+def cluster_id(url):
+    return hashlib.blake2b(url.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class NearDuplicateIndex:
+    # Índice LSH persistente en SQLite: por cada artículo su firma y su
+    # grupo, y una fila por banda. Buscar casi duplicados consulta solo los
+    # artículos que comparten alguna banda, no todo el corpus
+
+    def __init__(self, path, threshold=0.6, max_candidates=50):
+        self.path = path
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.db = None
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=30)
+        # WAL permite compartir el archivo entre los spiders de una corrida
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # En WAL, NORMAL no sincroniza en cada commit
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS signatures ("
+            "url TEXT PRIMARY KEY, cluster TEXT, signature BLOB)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS bands (key INTEGER, url TEXT)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS bands_key ON bands (key)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS bands_url ON bands (url)")
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def match(self, url, sig):
+        # Devuelve (grupo, similitud); similitud es None si el artículo no
+        # se parece a ninguno y abre un grupo propio
+        keys = band_keys(sig)
+        row = self.db.execute(
+            "SELECT cluster FROM signatures WHERE url = ?", (url,)
+        ).fetchone()
+        if row is not None:
+            # Artículo ya indexado (p. ej. una revisión): conserva su grupo
+            self.store(url, row[0], sig, keys)
+            return row[0], None
+
+        # Primero los candidatos que coinciden en más bandas: una banda que
+        # comparten muchas páginas de la misma plantilla no debe llenar el
+        # límite y dejar fuera al casi duplicado real
+        placeholders = ",".join("?" * len(keys))
+        candidates = self.db.execute(
+            "SELECT s.url, s.cluster, s.signature FROM ("
+            "SELECT b.url, COUNT(*) AS shared FROM bands b "
+            f"WHERE b.key IN ({placeholders}) GROUP BY b.url "
+            "ORDER BY shared DESC LIMIT ?"
+            ") c JOIN signatures s ON s.url = c.url ORDER BY c.shared DESC",
+            (*keys, self.max_candidates),
+        ).fetchall()
+
+        best_cluster, best = None, 0.0
+        for _, cluster, other in candidates:
+            score = similarity(sig, array("Q", other))
+            if score > best:
+                best_cluster, best = cluster, score
+
+        if best_cluster is not None and best >= self.threshold:
+            self.store(url, best_cluster, sig, keys)
+            return best_cluster, best
+
+        cluster = cluster_id(url)
+        self.store(url, cluster, sig, keys)
+        return cluster, None
+
+    def store(self, url, cluster, sig, keys):
+        self.db.execute("DELETE FROM bands WHERE url = ?", (url,))
+        self.db.execute(
+            "INSERT OR REPLACE INTO signatures VALUES (?, ?, ?)",
+            (url, cluster, sig.tobytes()),
+        )
+        self.db.executemany(
+            "INSERT INTO bands VALUES (?, ?)", [(key, url) for key in keys]
+        )
+        # Commit inmediato: una transacción abierta entre artículos bloquea
+        # a los demás spiders del mismo proceso, que comparten el hilo
+        self.db.commit()
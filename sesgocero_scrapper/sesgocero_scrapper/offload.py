@@ -0,0 +1,115 @@
+# Article extraction and cleaning in worker processes
+#
+# With PARSE_OFFLOAD_ENABLED, ArticleSpider.parse_article sends the body and
+# url of each article page to a process pool instead of parsing it on the
+# reactor thread. The workers run the extraction, date parsing and the
+# clean_html/normalize_text pass of MongoDBPipeline, and the finished values
+# come back to the spider through a Deferred, so downloads keep going while
+# pages are parsed on other cores. At most PARSE_OFFLOAD_MAX_PENDING pages
+# per crawl are queued or being parsed; the article callbacks beyond that
+# wait for a slot.
+#
+# The pool is shared by every crawl of the process (run_all runs all spiders
+# in one) and shut down when the last of them closes.
+
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+import os
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer
+
+from .metrics import stage_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def parse_offload(crawler):
+    # The ParseOffload extension of this crawler, or None if it is disabled
+    for extension in crawler.extensions.middlewares:
+        if isinstance(extension, ParseOffload):
+            return extension
+    return None
+
+
+class ParseOffload:
+    pool = None
+    users = 0
+
+    def __init__(self, crawler, workers, max_pending=32):
+        self.crawler = crawler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.stats = crawler.stats
+        self.metrics = None
+        self.slots = None
+        self.in_flight = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("PARSE_OFFLOAD_ENABLED"):
+            raise NotConfigured
+        ext = cls(
+            crawler,
+            settings.getint("PARSE_OFFLOAD_WORKERS") or os.cpu_count() or 1,
+            max_pending=settings.getint("PARSE_OFFLOAD_MAX_PENDING", 32),
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        # Looked up now: the other extensions do not exist yet in from_crawler
+        self.metrics = stage_metrics(self.crawler)
+        if ParseOffload.pool is None:
+            # spawn: forking a process with a running reactor and driver
+            # threads is not safe
+            ParseOffload.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info("Parsing articles in %d worker processes", self.workers)
+        ParseOffload.users += 1
+        self.slots = defer.DeferredSemaphore(self.max_pending)
+
+    def spider_closed(self, spider):
+        # Every callback has returned by now, so nothing of this crawl is
+        # left in the pool
+        ParseOffload.users -= 1
+        if ParseOffload.users == 0 and ParseOffload.pool is not None:
+            ParseOffload.pool.shutdown()
+            ParseOffload.pool = None
+
+    def submit(self, func, *args):
+        # Deferred firing with func(*args) as run by a worker process
+        return self.slots.run(self.run, func, *args)
+
+    def run(self, func, *args):
+        from twisted.internet import reactor
+
+        d = defer.Deferred()
+        started = time.perf_counter()
+        self.in_flight += 1
+        self.stats.max_value("offload/in_flight_max", self.in_flight)
+        future = ParseOffload.pool.submit(func, *args)
+        # Done callbacks run on the pool's management thread
+        future.add_done_callback(
+            lambda future: reactor.callFromThread(self.finished, d, future, started)
+        )
+        return d
+
+    def finished(self, d, future, started):
+        self.in_flight -= 1
+        if self.metrics is not None:
+            self.metrics.observe("parse_offload", time.perf_counter() - started)
+        error = future.exception()
+        if error is not None:
+            self.stats.inc_value("offload/errors")
+            d.errback(error)
+            return
+        self.stats.inc_value("offload/pages")
+        d.callback(future.result())
@@ -0,0 +1,24 @@
+# Shared "next page" handling for the listing pages of the news sites
+
+# Most sites mark the next listing page with rel="next"; WordPress themes
+# use a.next.page-numbers. Spiders can set next_page_selector to override it.
+NEXT_PAGE_SELECTOR = (
+    'link[rel="next"]::attr(href), a[rel="next"]::attr(href), '
+    "a.next.page-numbers::attr(href)"
+)
+
+
+def next_page_request(spider, response):
+    # Request for the listing page after this one, or None on the last page
+    # or once LISTING_MAX_PAGES pages have been read. Where the listing runs
+    # into already stored articles, KnownUrlsMiddleware drops this request.
+    page = response.meta.get("listing_page", 1)
+    max_pages = spider.settings.getint("LISTING_MAX_PAGES", 0)
+    if max_pages and page >= max_pages:
+        return None
+
+    selector = getattr(spider, "next_page_selector", NEXT_PAGE_SELECTOR)
+    href = response.css(selector).get()
+    if not href:
+        return None
+    return response.follow(href, callback=spider.parse, meta={"listing_page": page + 1})
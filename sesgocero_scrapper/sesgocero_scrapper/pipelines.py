@@ -1,34 +1,219 @@
 from itemadapter import ItemAdapter
-from pymongo import MongoClient
-from dotenv import load_dotenv
-from bs4 import BeautifulSoup
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.project import data_path
+from twisted.internet import defer, task, threads
+from twisted.python import threadable
+from twisted.python.threadpool import ThreadPool
 from datetime import datetime
-import os
-import re
+from .cleaning import CLEANED_FIELDS, clean_html, clean_item, normalize_text
+from .metrics import stage_metrics
+from .nearduplicates import NearDuplicateIndex, cluster_id, shingles, signature
+from .storage import MongoStorage, article_stored
+import hashlib
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Código de error de MongoDB para claves duplicadas
+DUPLICATE_KEY_ERROR = 11000
+
+# Campos que definen el contenido de un artículo
+HASHED_FIELDS = ["title", "subtitle", "content", "date"]
+
+# Textos con menos shingles no se comparan ("No content found", teasers)
+MIN_SHINGLES = 20
+
+
+class NearDuplicatePipeline:
+    # Marca cada artículo con un grupo de casi duplicados: las notas de
+    # agencia que varios medios publican casi palabra por palabra comparten
+    # duplicate_cluster. Las firmas MinHash del contenido limpio se guardan
+    # en un índice LSH persistente bajo .scrapy/
+
+    def __init__(self, path, threshold=0.6, stats=None, metrics=None):
+        self.index = NearDuplicateIndex(path, threshold=threshold)
+        self.stats = stats
+        self.metrics = metrics
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("NEAR_DUPLICATE_ENABLED"):
+            raise NotConfigured
+        return cls(
+            data_path(settings.get("NEAR_DUPLICATE_DB", "near_duplicates.db")),
+            threshold=settings.getfloat("NEAR_DUPLICATE_THRESHOLD", 0.6),
+            stats=crawler.stats,
+            metrics=stage_metrics(crawler),
+        )
+
+    def open_spider(self, spider):
+        self.index.open()
+
+    def close_spider(self, spider):
+        self.index.close()
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        url = adapter.get("url")
+        if not url or not adapter.get("content"):
+            return item
+
+        # Los campos limpios quedan en el artículo, así MongoDBPipeline no
+        # vuelve a limpiarlos
+        started = time.perf_counter()
+        if clean_item(adapter) and self.metrics is not None:
+            self.metrics.observe("clean_html", time.perf_counter() - started)
+
+        started = time.perf_counter()
+        hashes = shingles(adapter["content"])
+        if len(hashes) < MIN_SHINGLES:
+            self.stats.inc_value("near_duplicates/too_short", spider=spider)
+            adapter["duplicate_cluster"] = cluster_id(url)
+            return item
+
+        cluster, score = self.index.match(url, signature(hashes))
+        adapter["duplicate_cluster"] = cluster
+        if self.metrics is not None:
+            self.metrics.observe("near_duplicates", time.perf_counter() - started)
+        if score is not None:
+            self.stats.inc_value("near_duplicates/matched", spider=spider)
+            spider.logger.info(
+                "Casi duplicado (%.2f) en el grupo %s: %s", score, cluster, url
+            )
+        else:
+            self.stats.inc_value("near_duplicates/unique", spider=spider)
+        return item
+
 
 class MongoDBPipeline:
-    def __init__(self):
-        load_dotenv()
-        self.client = MongoClient(os.getenv("MONGODB_URI"))
-        self.db = self.client[os.getenv("MONGODB_DATABASE", "sesgocero")]
-        self.collection = self.db[os.getenv("MONGODB_COLLECTION", "articles")]
-        self.collection.create_index("url", unique=True)
+    def __init__(
+        self,
+        bulk_enabled=False,
+        bulk_size=100,
+        bulk_max_age=5.0,
+        async_enabled=False,
+        writer_threads=4,
+        max_pending=64,
+        stats=None,
+        metrics=None,
+        signals=None,
+    ):
+        # Cliente compartido por todos los spiders del proceso, se obtiene
+        # al abrir el spider
+        self.storage = None
+        self.collection = None
+
+        # Modo de escritura por lotes
+        self.bulk_enabled = bulk_enabled
+        self.bulk_size = bulk_size
+        self.bulk_max_age = bulk_max_age
+        self.stats = stats
+        self.metrics = metrics
+        self.signals = signals
+        self.buffer = []
+        self.buffer_started = None
+        self.flush_loop = None
+
+        # Modo de escritura en hilos aparte del reactor
+        self.async_enabled = async_enabled
+        self.writer_threads = writer_threads
+        self.max_pending = max_pending
+        self.writer = None
+        self.writer_slots = None
+        self.pending = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            bulk_enabled=settings.getbool("MONGODB_BULK_ENABLED", False),
+            bulk_size=settings.getint("MONGODB_BULK_SIZE", 100),
+            bulk_max_age=settings.getfloat("MONGODB_BULK_MAX_AGE", 5.0),
+            async_enabled=settings.getbool("MONGODB_ASYNC_ENABLED", False),
+            writer_threads=settings.getint("MONGODB_WRITER_THREADS", 4),
+            max_pending=settings.getint("MONGODB_MAX_PENDING_WRITES", 64),
+            stats=crawler.stats,
+            metrics=stage_metrics(crawler),
+            signals=crawler.signals,
+        )
+
+    def open_spider(self, spider):
+        self.storage = MongoStorage.acquire()
+        self.storage.ensure_indexes()
+        self.collection = self.storage.collection
+
+        if self.async_enabled:
+            self.writer = ThreadPool(
+                minthreads=1, maxthreads=self.writer_threads, name="mongodb-writer"
+            )
+            self.writer.start()
+            # Cola acotada: al llenarse, process_item devuelve un Deferred
+            # pendiente y Scrapy deja de entregar items
+            self.writer_slots = defer.DeferredSemaphore(self.max_pending)
+
+        if self.bulk_enabled and self.bulk_max_age > 0:
+            # Revisa periódicamente si el lote superó su edad máxima; cada
+            # cuarto de la edad máxima, para que ningún lote espere más de
+            # 1,25 veces MONGODB_BULK_MAX_AGE
+            self.flush_loop = task.LoopingCall(self.flush_if_stale, spider)
+            self.flush_loop.start(self.bulk_max_age / 4, now=False)
 
     def clean_html(self, text):
-        if not text:
-            return ""
-        soup = BeautifulSoup(text, "html.parser")
-        cleaned = soup.get_text(separator=" ", strip=True)
-        return re.sub(r"\s+", " ", cleaned)
+        return clean_html(text)
 
     def normalize_text(self, text):
-        if not text:
-            return ""
-        return re.sub(r"\s+", " ", text.strip())
+        return normalize_text(text)
+
+    def content_hash(self, adapter):
+        data = "\x1f".join(str(adapter.get(field) or "") for field in HASHED_FIELDS)
+        return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+    def upsert_filter(self, doc):
+        # Solo coincide si el contenido cambió; si el artículo existe con el
+        # mismo hash, el upsert choca con el índice único de url y no se
+        # escribe nada
+        return {"url": doc["url"], "content_hash": {"$ne": doc["content_hash"]}}
+
+    def update_doc(self, doc):
+        # updated_at con la hora del servidor: marca de agua de las
+        # exportaciones incrementales
+        return {"$set": doc, "$currentDate": {"updated_at": True}}
+
+    def in_reactor(self, func, *args, **kwargs):
+        if threadable.isInIOThread():
+            func(*args, **kwargs)
+        else:
+            # Ni las stats ni las señales son thread-safe: los escritores
+            # las llaman desde el reactor
+            from twisted.internet import reactor
+
+            reactor.callFromThread(func, *args, **kwargs)
+
+    def call_stats(self, method, *args, **kwargs):
+        if self.stats is None:
+            return
+        self.in_reactor(getattr(self.stats, method), *args, **kwargs)
+
+    def stored(self, urls, spider):
+        # Avisa qué artículos quedaron en la colección; RevalidationMiddleware
+        # guarda sus validadores solo entonces
+        if self.signals is None or not urls:
+            return
+        self.in_reactor(
+            self.signals.send_catch_log, article_stored, urls=urls, spider=spider
+        )
+
+    def inc_stat(self, key, spider, count=1):
+        self.call_stats("inc_value", key, count, spider=spider)
+
+    def observe(self, stage, started):
+        # Latencia de una etapa para la extensión de métricas
+        if self.metrics is not None:
+            self.metrics.observe(stage, time.perf_counter() - started)
 
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
@@ -38,32 +223,205 @@ class MongoDBPipeline:
             spider.logger.warning("Item descartado: faltante campo 'url'")
             return None
 
-        # Limpieza de campos de texto
-        for field in ["title", "subtitle", "content"]:
-            if adapter.get(field):
-                adapter[field] = self.normalize_text(
-                    self.clean_html(adapter.get(field))
-                )
+        # Limpieza de campos de texto, si no se hizo al extraer el artículo
+        if not adapter.get("cleaned"):
+            started = time.perf_counter()
+            for field in CLEANED_FIELDS:
+                if adapter.get(field):
+                    adapter[field] = self.normalize_text(
+                        self.clean_html(adapter.get(field))
+                    )
+            adapter["cleaned"] = True
+            self.observe("clean_html", started)
 
         # Fecha a ISO solo si es datetime
         if adapter.get("date") and isinstance(adapter["date"], datetime):
             adapter["date"] = adapter["date"].isoformat()
 
-        # Evitar updates si no hay cambios
-        existing = self.collection.find_one({"url": adapter["url"]})
-        if existing:
-            existing.pop("_id", None)
-            current_data = dict(adapter)
-            if all(existing.get(k) == current_data.get(k) for k in current_data):
-                return item
-
-        # Insertar o actualizar
-        self.collection.update_one(
-            {"url": adapter["url"]}, {"$set": dict(adapter)}, upsert=True
-        )
+        adapter["content_hash"] = self.content_hash(adapter)
+
+        if self.bulk_enabled:
+            return self.after_write(self.buffer_item(adapter, spider), item)
 
-        spider.logger.info(f"Artículo guardado: {adapter.get('title')}")
+        doc = dict(adapter)
+        if self.async_enabled:
+            return self.after_write(self.submit(self.write_item, doc, spider), item)
+
+        self.write_item(doc, spider)
         return item
 
+    def after_write(self, d, item):
+        if d is None:
+            return item
+        d.addCallback(lambda _: item)
+        return d
+
+    def write_item(self, doc, spider):
+        # Insertar o actualizar, evitando updates si no hay cambios
+        started = time.perf_counter()
+        try:
+            result = self.collection.update_one(
+                self.upsert_filter(doc), self.update_doc(doc), upsert=True
+            )
+        except DuplicateKeyError:
+            self.inc_stat("mongodb/items/unchanged", spider)
+            self.stored([doc["url"]], spider)
+            return
+        finally:
+            self.observe("mongodb_update_one", started)
+
+        if result.upserted_id is not None:
+            self.inc_stat("mongodb/items/inserted", spider)
+        else:
+            self.inc_stat("mongodb/items/updated", spider)
+        self.stored([doc["url"]], spider)
+
+        spider.logger.info("Artículo guardado: %s", doc.get("title"))
+
+    def submit(self, func, data, spider):
+        from twisted.internet import reactor
+
+        enqueued = time.monotonic()
+        d = self.writer_slots.run(
+            threads.deferToThreadPool,
+            reactor,
+            self.writer,
+            self.timed_write,
+            enqueued,
+            func,
+            data,
+            spider,
+        )
+        self.pending.add(d)
+        self.record_queue_depth(spider)
+
+        def done(result):
+            self.pending.discard(d)
+            self.record_queue_depth(spider)
+            return result
+
+        d.addBoth(done)
+        return d
+
+    def timed_write(self, enqueued, func, data, spider):
+        started = time.monotonic()
+        try:
+            return func(data, spider)
+        finally:
+            finished = time.monotonic()
+            wait_ms = int((started - enqueued) * 1000)
+            write_ms = int((finished - started) * 1000)
+            self.inc_stat("mongodb/writer/writes", spider)
+            self.inc_stat("mongodb/writer/write_time_ms", spider, write_ms)
+            self.call_stats(
+                "max_value", "mongodb/writer/write_time_ms_max", write_ms, spider=spider
+            )
+            self.call_stats(
+                "max_value", "mongodb/writer/wait_time_ms_max", wait_ms, spider=spider
+            )
+
+    def record_queue_depth(self, spider):
+        depth = len(self.pending)
+        self.call_stats("set_value", "mongodb/writer/queue_depth", depth, spider=spider)
+        self.call_stats(
+            "max_value", "mongodb/writer/queue_depth_max", depth, spider=spider
+        )
+
+    def buffer_item(self, adapter, spider):
+        if not self.buffer:
+            self.buffer_started = time.monotonic()
+        self.buffer.append(dict(adapter))
+
+        if len(self.buffer) >= self.bulk_size:
+            return self.flush(spider)
+
+    def flush_if_stale(self, spider):
+        if self.buffer and time.monotonic() - self.buffer_started >= self.bulk_max_age:
+            self.flush(spider)
+
+    def flush(self, spider):
+        if not self.buffer:
+            return None
+
+        batch, self.buffer = self.buffer, []
+        self.buffer_started = None
+
+        if self.async_enabled:
+            return self.submit(self.write_batch, batch, spider)
+        self.write_batch(batch, spider)
+        return None
+
+    def write_batch(self, batch, spider):
+        # Un mismo url dos veces en el lote chocaría consigo mismo en el
+        # upsert no ordenado: se conserva la última versión
+        docs = {}
+        for doc in batch:
+            if doc["url"] in docs:
+                spider.logger.warning("Artículo repetido en el lote: %s", doc["url"])
+                self.inc_stat("mongodb/bulk/duplicates_in_batch", spider)
+            docs[doc["url"]] = doc
+        docs = list(docs.values())
+
+        operations = [
+            UpdateOne(self.upsert_filter(doc), self.update_doc(doc), upsert=True)
+            for doc in docs
+        ]
+
+        started = time.perf_counter()
+        failed = set()
+        try:
+            result = self.collection.bulk_write(operations, ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            for error in details.get("writeErrors", []):
+                doc = docs[error["index"]]
+                if error.get("code") == DUPLICATE_KEY_ERROR:
+                    # El artículo ya existe con el mismo hash de contenido
+                    self.inc_stat("mongodb/items/unchanged", spider)
+                    spider.logger.debug("Artículo sin cambios: %s", doc["url"])
+                else:
+                    failed.add(doc["url"])
+                    self.inc_stat("mongodb/bulk/write_errors", spider)
+                    spider.logger.error(
+                        "Error guardando artículo %s: %s",
+                        doc["url"],
+                        error.get("errmsg"),
+                    )
+            for error in details.get("writeConcernErrors", []):
+                # No se sabe qué artículos quedaron escritos
+                failed.update(doc["url"] for doc in docs)
+                self.inc_stat("mongodb/bulk/write_concern_errors", spider)
+                spider.logger.error("Error de write concern: %s", error.get("errmsg"))
+        except PyMongoError as e:
+            self.observe("mongodb_bulk_write", started)
+            # Falló el lote completo: se reporta cada artículo
+            self.inc_stat("mongodb/bulk/write_errors", spider, len(docs))
+            for doc in docs:
+                spider.logger.error("Error guardando artículo %s: %s", doc["url"], e)
+            return
+
+        self.observe("mongodb_bulk_write", started)
+        self.inc_stat("mongodb/bulk/batches", spider)
+        self.inc_stat("mongodb/items/inserted", spider, details.get("nUpserted", 0))
+        self.inc_stat("mongodb/items/updated", spider, details.get("nModified", 0))
+        self.stored([doc["url"] for doc in docs if doc["url"] not in failed], spider)
+        spider.logger.info("Lote guardado: %d artículos", len(docs))
+
     def close_spider(self, spider):
-        self.client.close()
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush(spider)
+
+        if not self.async_enabled:
+            self.storage.release()
+            return None
+
+        # Esperar a que se vacíe la cola antes de cerrar la conexión
+        d = defer.DeferredList(list(self.pending), consumeErrors=True)
+        d.addBoth(lambda _: self.shutdown_writer())
+        return d
+
+    def shutdown_writer(self):
+        self.writer.stop()
+        self.storage.release()
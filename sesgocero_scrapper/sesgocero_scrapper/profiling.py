@@ -0,0 +1,232 @@
+# On-demand profiling of spider callbacks and pipeline / middleware methods
+#
+# PROFILE_TARGETS names the methods to run under cProfile, as Class.method
+# (ElTiempoSpider.parse_article, MongoDBPipeline.process_item) or with the
+# full module path. PROFILE_SAMPLE_RATE profiles that fraction of all spider
+# callbacks. At spider close every spider's profile is written to
+# PROFILE_DIR as <spider>.prof (for pstats or snakeviz) and <spider>.txt,
+# its functions ranked by own time. Nothing is patched or timed unless one
+# of the two is set.
+#
+# From the command line:
+#   scrapy crawl el_tiempo -s PROFILE_TARGETS=ElTiempoSpider.parse_article
+#   python run_all_spiders.py --profile MongoDBPipeline.process_item
+#   python run_all_spiders.py --profile-sample 0.05
+
+import cProfile
+import functools
+import inspect
+import io
+import logging
+import os
+import pstats
+import random
+
+from scrapy import Spider, signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.misc import load_object
+from scrapy.utils.project import data_path
+
+logger = logging.getLogger(__name__)
+
+# Settings whose classes can be named by their bare class name
+COMPONENT_SETTINGS = (
+    "ITEM_PIPELINES",
+    "SPIDER_MIDDLEWARES",
+    "DOWNLOADER_MIDDLEWARES",
+    "EXTENSIONS",
+)
+
+# Profiler of every open spider. Patched methods are shared by all the
+# crawlers of a process, so calls are routed by the spider they run for.
+PROFILERS = {}
+
+
+def callback_profiler(crawler):
+    # The CallbackProfiler extension of this crawler, or None if it is off
+    for extension in crawler.extensions.middlewares:
+        if isinstance(extension, CallbackProfiler):
+            return extension
+    return None
+
+
+def find_spider(args):
+    # Callbacks get the spider as self, pipelines and middlewares as an
+    # argument
+    for arg in args:
+        if isinstance(arg, Spider):
+            return arg
+    return None
+
+
+def component_classes(crawler):
+    classes = [crawler.spidercls]
+    for name in COMPONENT_SETTINGS:
+        for path, order in crawler.settings.getdict(name).items():
+            if order is None:
+                continue
+            try:
+                classes.append(load_object(path) if isinstance(path, str) else path)
+            except (ImportError, NameError, ValueError):
+                continue
+    return classes
+
+
+def resolve_target(crawler, target):
+    # (class, method name) for "Class.method" or "package.module.Class.method",
+    # None if it names nothing in this crawler
+    class_path, _, name = target.rpartition(".")
+    if not class_path:
+        return None
+    if "." in class_path:
+        try:
+            cls = load_object(class_path)
+        except (ImportError, NameError, ValueError):
+            return None
+    else:
+        cls = next(
+            (c for c in component_classes(crawler) if c.__name__ == class_path),
+            None,
+        )
+    if cls is None or not inspect.isfunction(inspect.getattr_static(cls, name, None)):
+        return None
+    return cls, name
+
+
+def profiled(func):
+    # Wraps func so the calls made for a spider with an open profiler run
+    # under it; generators are profiled while they produce each value
+    if getattr(func, "profiled", False):
+        return func
+
+    if inspect.isgeneratorfunction(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = PROFILERS.get(find_spider(args))
+            if profiler is None:
+                return (yield from func(*args, **kwargs))
+            return (yield from profiler.iterate(func(*args, **kwargs)))
+
+    else:
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = PROFILERS.get(find_spider(args))
+            if profiler is None:
+                return func(*args, **kwargs)
+            profiler.calls += 1
+            return profiler.run(func, *args, **kwargs)
+
+    wrapper.profiled = True
+    return wrapper
+
+
+class CallbackProfiler:
+    # Only one cProfile profiler can be enabled at a time; calls nested in
+    # an already profiled one are part of its profile
+    active = False
+
+    def __init__(self, directory, top=30):
+        self.directory = directory
+        self.top = top
+        self.profile = cProfile.Profile()
+        self.calls = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        targets = settings.getlist("PROFILE_TARGETS")
+        if not targets and settings.getfloat("PROFILE_SAMPLE_RATE", 0.0) <= 0:
+            raise NotConfigured
+        ext = cls(
+            data_path(settings.get("PROFILE_DIR", "profiles"), createdir=True),
+            top=settings.getint("PROFILE_TOP", 30),
+        )
+        # Extensions are built before the engine, so pipelines and
+        # middlewares pick up the patched methods
+        for target in targets:
+            resolved = resolve_target(crawler, target)
+            if resolved is None:
+                logger.debug("Profiling target %s is not part of this crawl", target)
+                continue
+            owner, name = resolved
+            setattr(owner, name, profiled(inspect.getattr_static(owner, name)))
+            logger.info("Profiling %s", target)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def run(self, func, *args, **kwargs):
+        if CallbackProfiler.active:
+            return func(*args, **kwargs)
+        CallbackProfiler.active = True
+        self.profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.profile.disable()
+            CallbackProfiler.active = False
+
+    def iterate(self, iterable):
+        self.calls += 1
+        iterator = iter(iterable)
+        while True:
+            try:
+                i = self.run(next, iterator)
+            except StopIteration:
+                return
+            yield i
+
+    def spider_opened(self, spider):
+        PROFILERS[spider] = self
+
+    def spider_closed(self, spider):
+        PROFILERS.pop(spider, None)
+        if not self.calls:
+            logger.info("Nothing was profiled")
+            return
+
+        path = os.path.join(self.directory, spider.name)
+        self.profile.dump_stats(path + ".prof")
+
+        out = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=out).strip_dirs()
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+        with open(path + ".txt", "w") as f:
+            f.write(f"{self.calls} profiled calls of {spider.name}\n")
+            f.write(out.getvalue())
+
+        hottest = [
+            f"{function} ({file}:{line}) {stats.stats[(file, line, function)][2]:.3f}s"
+            for file, line, function in stats.fcn_list[:5]
+        ]
+        logger.info(
+            "Profiled %d calls, written to %s.prof; hottest functions by own "
+            "time:\n  %s",
+            self.calls,
+            path,
+            "\n  ".join(hottest),
+        )
+
+
+class ProfilingMiddleware:
+    # Spider middleware next to the spider: profiles PROFILE_SAMPLE_RATE of
+    # all spider callbacks
+
+    def __init__(self, profiler, sample_rate):
+        self.profiler = profiler
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        profiler = callback_profiler(crawler)
+        sample_rate = crawler.settings.getfloat("PROFILE_SAMPLE_RATE", 0.0)
+        if profiler is None or sample_rate <= 0:
+            raise NotConfigured
+        return cls(profiler, sample_rate)
+
+    def process_spider_output(self, response, result, spider):
+        if random.random() >= self.sample_rate:
+            return result
+        return self.profiler.iterate(result)
@@ -1,22 +1,238 @@
 # run_all_spiders.py
+import argparse
+import multiprocessing
+import queue
+import sys
+import traceback
+
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 from scrapy.utils.log import configure_logging
 from scrapy import spiderloader
 
 
-def run_all():
+def replay_settings(settings):
+    # Serve every request from the HTTP cache and ignore anything missing.
+    # Filters that skip already-seen articles would drop cached pages too.
+    settings.set("HTTPCACHE_ENABLED", True)
+    settings.set("HTTPCACHE_REPLAY", True)
+    settings.set("HTTPCACHE_IGNORE_MISSING", True)
+    settings.set("KNOWN_URLS_ENABLED", False)
+    settings.set("REVALIDATION_ENABLED", False)
+
+
+def crawler_process(replay=False, overrides=None):
     settings = get_project_settings()
+    if replay:
+        replay_settings(settings)
+    if overrides:
+        settings.setdict(overrides, priority="cmdline")
     configure_logging(settings)
-    process = CrawlerProcess(settings)
+    return settings, CrawlerProcess(settings)
+
+
+def run_all(replay=False, spider_names=None, overrides=None):
+    settings, process = crawler_process(replay, overrides)
 
     spider_loader = spiderloader.SpiderLoader.from_settings(settings)
-    for spider_name in spider_loader.list():
+    crawlers = []
+    for spider_name in spider_names or spider_loader.list():
         print(f"\n\nEjecutando spider: {spider_name}\n{30*'-*-'}\n")
-        process.crawl(spider_name)
+        crawler = process.create_crawler(spider_name)
+        crawlers.append(crawler)
+        process.crawl(crawler)
 
     process.start()
 
+    # Stats of every spider, by name
+    return {crawler.spidercls.name: crawler.stats.get_stats() for crawler in crawlers}
+
+
+def run_daemon(replay=False, spider_names=None, overrides=None):
+    # Crawls every spider again and again in this process until interrupted
+    settings, process = crawler_process(replay, overrides)
+    # Importable once the settings have put the project on sys.path
+    from sesgocero_scrapper.daemon import CrawlDaemon
+
+    spider_loader = spiderloader.SpiderLoader.from_settings(settings)
+    CrawlDaemon(process, spider_names or spider_loader.list(), settings).start()
+    process.start(stop_after_crawl=False)
+
+
+def shard_spiders(spider_names, workers, weights):
+    # Heaviest spiders first, each to the least loaded worker
+    shards = [[] for _ in range(workers)]
+    loads = [0.0] * workers
+    for name in sorted(spider_names, key=lambda n: -weights.get(n, 1)):
+        i = loads.index(min(loads))
+        shards[i].append(name)
+        loads[i] += weights.get(name, 1)
+    return [shard for shard in shards if shard]
+
+
+def run_shard(spider_names, replay, overrides, results):
+    # Runs in a worker process, with its own reactor
+    try:
+        stats = run_all(replay=replay, spider_names=spider_names, overrides=overrides)
+    except Exception:
+        results.put((spider_names, None, traceback.format_exc()))
+        sys.exit(1)
+    results.put((spider_names, stats, None))
+
+
+def run_sharded(workers=None, replay=False, spider_names=None, overrides=None):
+    settings = get_project_settings()
+    spider_loader = spiderloader.SpiderLoader.from_settings(settings)
+    spider_names = spider_names or spider_loader.list()
+    workers = (
+        workers or settings.getint("RUNNER_WORKERS") or multiprocessing.cpu_count()
+    )
+    weights = settings.getdict("SPIDER_WEIGHTS")
+    shards = shard_spiders(spider_names, workers, weights)
+
+    # spawn: every worker starts a clean interpreter and reactor
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = []
+    for shard in shards:
+        print(f"Shard {len(processes) + 1}/{len(shards)}: {', '.join(shard)}")
+        p = context.Process(
+            target=run_shard, args=(shard, replay, overrides, results), daemon=False
+        )
+        p.start()
+        processes.append((shard, p))
+
+    # Read results before joining so full queues do not block the workers
+    stats = {}
+    errors = {}
+    reported = []
+
+    def record(result):
+        shard, shard_stats, error = result
+        reported.append(shard)
+        if error:
+            errors[", ".join(shard)] = error
+        else:
+            stats.update(shard_stats)
+
+    while len(reported) < len(processes):
+        try:
+            record(results.get(timeout=1))
+        except queue.Empty:
+            if any(p.is_alive() for _, p in processes):
+                continue
+            # Every worker has exited, but one may have reported after the
+            # timeout above: read what is left before giving up on the rest
+            while True:
+                try:
+                    record(results.get_nowait())
+                except queue.Empty:
+                    break
+            break
+
+    failed = False
+    for shard, p in processes:
+        p.join()
+        if p.exitcode != 0:
+            failed = True
+            print(f"Shard [{', '.join(shard)}] exited with code {p.exitcode}")
+        elif shard not in reported:
+            # Its stats are missing from the summary
+            failed = True
+            print(f"Shard [{', '.join(shard)}] exited without reporting its stats")
+    for shard, error in errors.items():
+        failed = True
+        print(f"Shard [{shard}] failed:\n{error}")
+
+    failed = print_summary(stats) or failed
+    return 1 if failed else 0
+
+
+def print_summary(stats):
+    # Per-spider summary plus totals; returns True if any spider did not
+    # finish cleanly
+    failed = False
+    totals = {}
+    print(f"\n{'spider':<15} {'items':>7} {'pages':>7} {'errors':>7}  finish reason")
+    for name, spider_stats in sorted(stats.items()):
+        reason = spider_stats.get("finish_reason")
+        if reason != "finished":
+            failed = True
+        print(
+            f"{name:<15} {spider_stats.get('item_scraped_count', 0):>7} "
+            f"{spider_stats.get('response_received_count', 0):>7} "
+            f"{spider_stats.get('log_count/ERROR', 0):>7}  {reason}"
+        )
+        for key, value in spider_stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[key] = totals.get(key, 0) + value
+
+    print(
+        f"{'total':<15} {totals.get('item_scraped_count', 0):>7} "
+        f"{totals.get('response_received_count', 0):>7} "
+        f"{totals.get('log_count/ERROR', 0):>7}"
+    )
+    return failed
+
 
 if __name__ == "__main__":
-    run_all()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="replay responses from the HTTP cache without using the network",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="?",
+        const=0,
+        help="spread spiders over worker processes (default: RUNNER_WORKERS "
+        "or one per CPU core)",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and crawl every source again on an interval that "
+        "follows how often it publishes",
+    )
+    parser.add_argument(
+        "--profile",
+        action="append",
+        metavar="CLASS.METHOD",
+        help="run this method under cProfile, e.g. ElTiempoSpider.parse_article "
+        "or MongoDBPipeline.process_item (repeatable)",
+    )
+    parser.add_argument(
+        "--profile-sample",
+        type=float,
+        metavar="RATE",
+        help="run this fraction of all spider callbacks under cProfile",
+    )
+    parser.add_argument(
+        "--parse-offload",
+        type=int,
+        nargs="?",
+        const=0,
+        metavar="WORKERS",
+        help="extract and clean articles in worker processes (default: "
+        "PARSE_OFFLOAD_WORKERS or one per CPU core)",
+    )
+    args = parser.parse_args()
+    overrides = {}
+    if args.parse_offload is not None:
+        overrides["PARSE_OFFLOAD_ENABLED"] = True
+        if args.parse_offload:
+            overrides["PARSE_OFFLOAD_WORKERS"] = args.parse_offload
+    if args.profile:
+        overrides["PROFILE_TARGETS"] = args.profile
+    if args.profile_sample:
+        overrides["PROFILE_SAMPLE_RATE"] = args.profile_sample
+    if args.daemon:
+        run_daemon(replay=args.replay, overrides=overrides)
+    elif args.workers is None:
+        run_all(replay=args.replay, overrides=overrides)
+    else:
+        sys.exit(
+            run_sharded(workers=args.workers, replay=args.replay, overrides=overrides)
+        )
@@ -18,6 +18,8 @@ NEWSPIDER_MODULE = "sesgocero_scrapper.spiders"
 
 # Obey robots.txt rules
 ROBOTSTXT_OBEY = True
+# Seconds a fetched robots.txt is reused by later crawls in the same process
+ROBOTSTXT_CACHE_TTL = 86400
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
 CONCURRENT_REQUESTS = 16
@@ -25,6 +27,7 @@ CONCURRENT_REQUESTS = 16
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
+# With ADAPTIVE_THROTTLE_ENABLED this is only the starting delay of each domain
 DOWNLOAD_DELAY = 0.5
 # The download delay setting will honor only one of:
 # CONCURRENT_REQUESTS_PER_DOMAIN = 16
@@ -47,25 +50,173 @@ DOWNLOAD_DELAY = 0.5
 # SPIDER_MIDDLEWARES = {
 #    "sesgocero_scrapper.middlewares.SesgoceroScrapperSpiderMiddleware": 543,
 # }
+SPIDER_MIDDLEWARES = {
+    "sesgocero_scrapper.middlewares.KnownUrlsMiddleware": 550,
+    "sesgocero_scrapper.metrics.StageTimingMiddleware": 950,
+    "sesgocero_scrapper.profiling.ProfilingMiddleware": 960,
+}
+
+# Skip article requests whose url is already stored in MongoDB. Articles
+# published in the last KNOWN_URLS_REFETCH_DAYS days are still re-fetched so
+# revisions get picked up; spiders can override it in custom_settings.
+KNOWN_URLS_ENABLED = True
+KNOWN_URLS_REFETCH_DAYS = 0
+# Stop following "next page" links once this many listing entries in a row
+# are already stored (0: never stop early). LISTING_MAX_PAGES caps the depth
+# of every listing either way (0: no cap).
+KNOWN_URLS_STOP_AFTER = 10
+# The daemon keeps the known urls between crawls, adding the articles it
+# stores; they are loaded from MongoDB again after this many seconds
+KNOWN_URLS_CACHE_TTL = 86400
+LISTING_MAX_PAGES = 50
+
+# How spiders find articles: "listing" scrapes the HTML listing pages,
+# "feeds" reads the site's sitemaps / RSS (feed_urls, or the Sitemap: lines
+# of robots.txt) and requests only entries newer than the start of the last
+# successful feeds run, minus DISCOVERY_OVERLAP seconds. Spiders also take
+# `-a discovery=feeds`. Last run times are kept in a SQLite file under .scrapy/.
+DISCOVERY_MODE = "listing"
+DISCOVERY_DB = "discovery.db"
+DISCOVERY_OVERLAP = 3600
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 # DOWNLOADER_MIDDLEWARES = {
 #    "sesgocero_scrapper.middlewares.SesgoceroScrapperDownloaderMiddleware": 543,
 # }
+DOWNLOADER_MIDDLEWARES = {
+    # Keeps robots.txt across the crawls of a process
+    "scrapy.downloadermiddlewares.robotstxt.RobotsTxtMiddleware": None,
+    "sesgocero_scrapper.middlewares.SharedRobotsTxtMiddleware": 100,
+    # Below HttpCompressionMiddleware (590) so bodies are hashed decompressed
+    "sesgocero_scrapper.middlewares.RevalidationMiddleware": 580,
+    # Next to the downloader so it sees every response and download error
+    "sesgocero_scrapper.middlewares.AdaptiveThrottleMiddleware": 950,
+}
+
+# Adapt the concurrency and delay of every domain to how it responds. Each
+# domain starts at DOWNLOAD_DELAY and ADAPTIVE_THROTTLE_START_CONCURRENCY;
+# healthy responses lower the delay and raise the concurrency, while 429/503
+# responses, download errors and latency above ADAPTIVE_THROTTLE_TARGET_LATENCY
+# seconds (or ADAPTIVE_THROTTLE_LATENCY_FACTOR times the fastest seen) back
+# off. Retry-After is honored. Current values are in the throttle/slots/*
+# stats.
+ADAPTIVE_THROTTLE_ENABLED = True
+ADAPTIVE_THROTTLE_START_CONCURRENCY = 2
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 16
+ADAPTIVE_THROTTLE_MIN_DELAY = 0
+ADAPTIVE_THROTTLE_MAX_DELAY = 60
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 2.0
+ADAPTIVE_THROTTLE_LATENCY_FACTOR = 3.0
+ADAPTIVE_THROTTLE_MAX_ERROR_RATE = 0.1
+
+# Send If-None-Match / If-Modified-Since for article pages fetched before.
+# Validators and body hashes are kept in a SQLite file under .scrapy/.
+REVALIDATION_ENABLED = True
+REVALIDATION_DB = "revalidation.db"
+
+# Stop parsing an article page once every required field has matched, so
+# the related stories and footers after the body are never parsed. Optional
+# fields that only appear further down the page come out empty.
+PARTIAL_PARSING = False
+
+# `run_all_spiders.py --daemon` crawls every source again and again in one
+# process. The first crawls of a source are DAEMON_INTERVAL seconds apart;
+# after that the interval follows its publishing rate (a moving average with
+# weight DAEMON_SMOOTHING on the latest crawl) so that about
+# DAEMON_TARGET_NEW new articles are found per crawl, between
+# DAEMON_MIN_INTERVAL and DAEMON_MAX_INTERVAL seconds. Learned intervals are
+# kept in DAEMON_DB under .scrapy/.
+DAEMON_INTERVAL = 900
+DAEMON_MIN_INTERVAL = 300
+DAEMON_MAX_INTERVAL = 21600
+DAEMON_TARGET_NEW = 5
+DAEMON_SMOOTHING = 0.3
+DAEMON_DB = "daemon.db"
+
+# Extract and clean article pages in PARSE_OFFLOAD_WORKERS worker processes
+# (0: one per CPU core) instead of on the reactor thread, so parsing runs on
+# other cores while pages download. At most PARSE_OFFLOAD_MAX_PENDING pages
+# per spider are queued or being parsed; further article callbacks wait.
+# With run_all_spiders.py --workers every worker process has its own pool.
+PARSE_OFFLOAD_ENABLED = False
+PARSE_OFFLOAD_WORKERS = 0
+PARSE_OFFLOAD_MAX_PENDING = 32
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 # EXTENSIONS = {
 #    "scrapy.extensions.telnet.TelnetConsole": None,
 # }
+EXTENSIONS = {
+    "sesgocero_scrapper.metrics.StageMetrics": 500,
+    "sesgocero_scrapper.profiling.CallbackProfiler": 500,
+    "sesgocero_scrapper.offload.ParseOffload": 500,
+    "sesgocero_scrapper.logs.LoggingProfile": 0,
+}
+
+# Logging. LOG_PROFILE = "production" writes one JSON object per line and
+# lets through at most LOG_RATE_LIMIT repeats of a warning per spider and
+# reason every LOG_RATE_WINDOW seconds; use it with LOG_LEVEL = "INFO". The
+# MongoDB driver logs are capped at LOG_DRIVER_LEVEL in every profile and go
+# to LOG_DRIVER_FILE instead of the crawl log when it is set.
+LOG_PROFILE = "default"
+LOG_RATE_LIMIT = 10
+LOG_RATE_WINDOW = 60
+LOG_DRIVER_LEVEL = "WARNING"
+LOG_DRIVER_FILE = None
+
+# Per-stage latency histograms (download, spider callbacks, clean_html,
+# near-duplicate lookup, MongoDB writes) and counters for skipped articles,
+# date parse failures and pipeline outcomes. Every METRICS_INTERVAL seconds
+# and at close they are written to METRICS_DIR (under .scrapy/) as
+# <spider>.prom, for the node_exporter textfile collector, and at close as a
+# <spider>.json summary with p50/p95/p99. Set METRICS_PORT to also serve them
+# on http://127.0.0.1:<port>/metrics.
+METRICS_ENABLED = True
+METRICS_DIR = "metrics"
+METRICS_INTERVAL = 15
+METRICS_PORT = 0
+
+# Run methods under cProfile: PROFILE_TARGETS as Class.method, e.g.
+# ["ElTiempoSpider.parse_article", "MongoDBPipeline.process_item"], and/or a
+# PROFILE_SAMPLE_RATE fraction of all spider callbacks. Profiles and a
+# summary of the PROFILE_TOP hottest functions go to PROFILE_DIR (under
+# .scrapy/) at spider close. Off by default.
+PROFILE_TARGETS = []
+PROFILE_SAMPLE_RATE = 0
+PROFILE_DIR = "profiles"
+PROFILE_TOP = 30
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
+    "sesgocero_scrapper.pipelines.NearDuplicatePipeline": 250,
     "sesgocero_scrapper.pipelines.MongoDBPipeline": 300,
 }
 
+# Tag every article with a duplicate_cluster id shared by near-identical
+# articles (wire stories republished by several sources). Signatures live in
+# a persistent LSH index (SQLite under .scrapy/); articles whose estimated
+# Jaccard similarity reaches NEAR_DUPLICATE_THRESHOLD join the same cluster.
+NEAR_DUPLICATE_ENABLED = True
+NEAR_DUPLICATE_DB = "near_duplicates.db"
+NEAR_DUPLICATE_THRESHOLD = 0.6
+
+# Buffer items and write them to MongoDB with one unordered bulk_write per
+# batch. A batch is flushed when it reaches MONGODB_BULK_SIZE items or when
+# its oldest item is MONGODB_BULK_MAX_AGE seconds old, and on spider close.
+MONGODB_BULK_ENABLED = False
+MONGODB_BULK_SIZE = 100
+MONGODB_BULK_MAX_AGE = 5.0
+
+# Run MongoDB writes on a dedicated thread pool instead of the reactor
+# thread. At most MONGODB_MAX_PENDING_WRITES writes are queued or running;
+# beyond that process_item returns a pending Deferred so Scrapy backs off.
+MONGODB_ASYNC_ENABLED = False
+MONGODB_WRITER_THREADS = 4
+MONGODB_MAX_PENDING_WRITES = 64
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 # AUTOTHROTTLE_ENABLED = True
@@ -87,6 +238,20 @@ ITEM_PIPELINES = {
 # HTTPCACHE_IGNORE_HTTP_CODES = []
 # HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
 
+# Compressed, deduplicated cache storage used when HTTPCACHE_ENABLED is set.
+# Least recently used responses are evicted beyond HTTPCACHE_MAX_BYTES of
+# compressed bodies. HTTPCACHE_REPLAY serves the cache as-is (no expiration,
+# no writes); `python run_all_spiders.py --replay` sets it together with
+# HTTPCACHE_IGNORE_MISSING so a run never touches the network.
+HTTPCACHE_STORAGE = "sesgocero_scrapper.httpcache.CompressedCacheStorage"
+HTTPCACHE_MAX_BYTES = 512 * 1024 * 1024
+HTTPCACHE_REPLAY = False
+
+# Worker processes used by `run_all_spiders.py --workers` (0: one per CPU
+# core) and the relative cost of each spider, used to balance the shards
+RUNNER_WORKERS = 0
+SPIDER_WEIGHTS = {}
+
 # Set settings whose default value is deprecated to a future-proof value
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
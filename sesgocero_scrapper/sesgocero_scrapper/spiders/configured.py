@@ -0,0 +1,16 @@
+# Spiders generated from the sources.json entries that have no module of
+# their own in this package, so adding an outlet only takes a new entry
+
+import os
+
+from ..extraction import EXTRACTORS, ArticleSpider
+
+SPIDERS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+for name in EXTRACTORS:
+    if os.path.exists(os.path.join(SPIDERS_DIR, f"{name}.py")):
+        continue
+    class_name = "".join(part.capitalize() for part in name.split("_")) + "Spider"
+    globals()[class_name] = type(
+        class_name, (ArticleSpider,), {"name": name, "__module__": __name__}
+    )
@@ -0,0 +1,82 @@
+# Process-wide MongoDB storage
+#
+# run_all runs every spider in one process, and the daemon runs crawl after
+# crawl in one. Instead of a MongoClient per crawl, each with its own
+# topology monitor and connection pools, MongoDBPipeline and the known-url
+# loader share one MongoStorage per collection: acquire() returns it and
+# opens the client the first time, release() closes the client when the
+# last user is done. The indexes are created once per process, by the first
+# user that writes.
+
+import logging
+import os
+import threading
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, MongoClient
+
+logger = logging.getLogger(__name__)
+
+# Sent by MongoDBPipeline, from the reactor thread, with the urls of the
+# articles a write confirmed are in the collection: inserted, updated, or
+# already there with the same content. Arguments: urls, spider.
+article_stored = object()
+
+# (keys, options) of every index of the articles collection
+INDEXES = [
+    ("url", {"unique": True}),
+    # Articles of a source by date, and the export order
+    ([("source", ASCENDING), ("date", ASCENDING)], {}),
+    # Incremental exports
+    ("updated_at", {}),
+]
+
+
+def collection_settings():
+    load_dotenv()
+    return (
+        os.getenv("MONGODB_URI"),
+        os.getenv("MONGODB_DATABASE", "sesgocero"),
+        os.getenv("MONGODB_COLLECTION", "articles"),
+    )
+
+
+class MongoStorage:
+    instances = {}
+    lock = threading.Lock()
+
+    def __init__(self, uri, database, collection):
+        self.key = (uri, database, collection)
+        self.client = MongoClient(uri)
+        self.collection = self.client[database][collection]
+        self.users = 0
+        self.indexes_ready = False
+
+    @classmethod
+    def acquire(cls):
+        key = collection_settings()
+        with cls.lock:
+            storage = cls.instances.get(key)
+            if storage is None:
+                storage = cls.instances[key] = cls(*key)
+            storage.users += 1
+        return storage
+
+    def release(self):
+        with self.lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            del self.instances[self.key]
+        self.client.close()
+
+    def ensure_indexes(self):
+        # create_index is a round trip to the server even when the index
+        # exists, so it is only sent by the first user
+        with self.lock:
+            if self.indexes_ready:
+                return
+            for keys, options in INDEXES:
+                name = self.collection.create_index(keys, **options)
+                logger.debug("Index %s ready", name)
+            self.indexes_ready = True
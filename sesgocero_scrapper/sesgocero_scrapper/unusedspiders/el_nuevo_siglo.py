@@ -3,22 +3,18 @@
 import scrapy
 from bs4 import BeautifulSoup
 from ..items import NewsItem
-from datetime import datetime
+from ..dates import parse_date
+from ..discovery import FeedDiscoveryMixin
+from ..pagination import next_page_request
+from ..metrics import check_required
 from urllib.parse import urljoin
-import re
-import logging
 
-# Set up logging
-logging.basicConfig(level=logging.CRITICAL)  # Change to WARNING or higher
 
-
-class ElNuevoSigloSpider(scrapy.Spider):
+class ElNuevoSigloSpider(FeedDiscoveryMixin, scrapy.Spider):
     name = "el_nuevo_siglo"
     start_urls = ["https://www.elnuevosiglo.com.co/politica-0"]
     custom_settings = {
         # "ROBOTSTXT_OBEY": True,
-        "DOWNLOAD_DELAY": 0.5,  # Add delay between requests
-        "CONCURRENT_REQUESTS": 16,
     }
 
     def parse(self, response):
@@ -30,6 +26,12 @@ class ElNuevoSigloSpider(scrapy.Spider):
             absolute_url = urljoin(response.url, url)
             yield response.follow(absolute_url, callback=self.parse_article)
 
+        # Continue with the next listing page, last so the known-url check
+        # has seen every entry of this one
+        next_page = next_page_request(self, response)
+        if next_page:
+            yield next_page
+
     def parse_article(self, response):
         try:
             # Extract title with fallback
@@ -61,11 +63,19 @@ class ElNuevoSigloSpider(scrapy.Spider):
                 if date_str:
                     break
 
-            # Parse the date using our helper method
-            date = self.parse_date(date_str)
+            # Parse the date using the shared parser
+            date = parse_date(date_str)
+            if date_str and not date:
+                self.logger.warning(
+                    "Could not parse date: %s", date_str, extra={"reason": "date"}
+                )
+                self.crawler.stats.inc_value("dates/parse_failed")
 
             # Yield item
-            if title and subtitle and content and date:
+            missing = check_required(
+                self, title=title, subtitle=subtitle, content=content, date=date
+            )
+            if not missing:
                 yield NewsItem(
                     title=title.strip(),
                     subtitle=subtitle.strip(),
@@ -76,49 +86,4 @@ class ElNuevoSigloSpider(scrapy.Spider):
                     cleaned=False,
                 )
         except Exception as e:
-            self.logger.error(f"Error parsing article: {e}")
-
-    def parse_date(self, date_str):
-        """Helper method to parse different date formats"""
-        if not date_str:
-            return None
-
-        # Spanish month mapping
-        month_map = {
-            "enero": "01",
-            "febrero": "02",
-            "marzo": "03",
-            "abril": "04",
-            "mayo": "05",
-            "junio": "06",
-            "julio": "07",
-            "agosto": "08",
-            "septiembre": "09",
-            "octubre": "10",
-            "noviembre": "11",
-            "diciembre": "12",
-        }
-
-        try:
-            # Remove time information if present
-            date_str = date_str.split(" , ")[1].strip()
-
-            # Extract day, month, and year using regex
-            pattern = r"(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})"
-            match = re.search(pattern, date_str.lower())
-
-            if match:
-                day, month, year = match.groups()
-                # Convert Spanish month name to number
-                month_num = month_map.get(month.lower())
-                if month_num:
-                    # Format as YYYY-MM-DD
-                    formatted_date = f"{year}-{month_num}-{day.zfill(2)}"
-                    return datetime.strptime(formatted_date, "%Y-%m-%d")
-
-            self.logger.warning(f"Could not parse Spanish date format: {date_str}")
-            return None
-
-        except Exception as e:
-            self.logger.warning(f"Error parsing date {date_str}: {str(e)}")
-            return None
+            self.logger.error("Error parsing article %s: %s", response.url, e)